@@ -0,0 +1,148 @@
+# step timing benchmarks for seq.py on micropython's unix port, printed the
+# same way as python -m sim.bench so the two can be put side by side
+#
+#   micropython bench.py [--steps 256] > bench_output.txt
+#
+# play_step is the clock's work for a step, the channels' steps and the midi
+# bytes for them, and build_frame is the pattern view's leds. the timeline
+# runs the clock against the real one with no second core, so the keys are
+# polled in between steps as they'd be on a single core
+
+import random
+import sys
+import time
+
+import seq
+
+
+def set_cell(channel, note, step, value):
+    seq.set_note(channel, note, step, value)
+
+
+def empty_pattern():
+    pass
+
+
+def drums_pattern():
+    for step in range(16):
+        if step % 4 == 0:
+            set_cell(9, 0, step, 1)
+        if step % 8 == 4:
+            set_cell(9, 1, step, 1)
+        if step % 2 == 0:
+            set_cell(9, 6, step, 1)
+
+
+def dense_pattern():
+    random.seed(16)
+    for channel in range(16):
+        for note in range(16):
+            for step in range(16):
+                roll = random.random()
+                if roll < 0.5:
+                    set_cell(channel, note, step, 1)
+                elif roll < 0.7 and channel != 9:
+                    set_cell(channel, note, step, 2)
+
+
+patterns = [
+    ("empty", empty_pattern),
+    ("drums", drums_pattern),
+    ("dense", dense_pattern),
+]
+
+
+def load(fill):
+    seq.clear_pattern()
+    for i in range(len(seq.sounding)):
+        seq.sounding[i] = 0
+    fill()
+    seq.channel = 9
+    seq.note = 0
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return [0] * 4
+    
+    def at(fraction):
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+    return [at(0.5), at(0.9), at(0.99), values[-1]]
+
+
+def play_step(tick):
+    seq.advance(tick)
+    return seq.fill_step(seq.channel_steps, seq.midi_buffer)
+
+
+def build_frame(tick):
+    seq.step = seq.channel_steps[seq.channel]
+    seq.build_frame()
+    return 0
+
+
+def measure_functions(fill, steps):
+    load(fill)
+    results = []
+    for name, call in (("play_step", play_step), ("build_frame", build_frame)):
+        host = []
+        midi_bytes = []
+        for tick in range(steps):
+            start = time.ticks_us()
+            count = call(tick)
+            host.append(time.ticks_diff(time.ticks_us(), start))
+            midi_bytes.append(count)
+        results.append((name, host, midi_bytes))
+    return results
+
+
+def measure_timeline(fill, steps):
+    # a quicker tempo than usual so it doesn't take all day
+    load(fill)
+    seq.step_length = 20000
+    seq.tick = 0
+    seq.running = True
+    seq.send_clock = False
+    seq.midi_out.show = False
+    lateness = []
+    fired = []
+    
+    def poll():
+        if seq.tick != len(fired):
+            fired.append(time.ticks_us())
+            lateness.append(seq.lateness)
+        if seq.tick >= steps:
+            seq.running = False
+    
+    seq.clock_loop(poll)
+    periods = [time.ticks_diff(b, a) for a, b in zip(fired, fired[1:])]
+    return lateness, periods, seq.step_length
+
+
+def row(label, values, scale=1):
+    return "  {:<30}".format(label) + "".join("{:>10.1f}".format(value / scale) for value in values)
+
+
+def main():
+    steps = 256
+    if len(sys.argv) > 2 and sys.argv[1] == "--steps":
+        steps = int(sys.argv[2])
+    
+    header = "  {:<30}{:>10}{:>10}{:>10}{:>10}".format("", "p50", "p90", "p99", "max")
+    for name, fill in patterns:
+        print("{} pattern, {} steps".format(name, steps))
+        print(header)
+        results = measure_functions(fill, steps)
+        for function, host, midi_bytes in results:
+            print(row(function + " host us", percentiles(host)))
+        print(row("midi bytes/step", percentiles(results[0][2])))
+        
+        lateness, periods, step_length = measure_timeline(fill, steps)
+        print(row("step lateness us", percentiles(lateness)))
+        jitter = [abs(period - step_length) for period in periods]
+        print(row("period jitter us", percentiles(jitter)))
+        print()
+
+
+main()
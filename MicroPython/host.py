@@ -0,0 +1,137 @@
+# stand-ins for the picokeypad module and the midi uart so seq.py runs on
+# micropython's unix port, for trying things out and benchmarking on the
+# computer. key presses are played back on the real clock
+#
+#   micropython seq.py --seconds 4 --press 15@0.5+0.8 --press 4@1.6 --midi
+#
+# --one-core runs the clock and the keys on the same thread as a pico without
+# the second core would, --frames prints every led frame pushed
+
+import sys
+import time
+
+# when the run started, for the times printed
+started = time.ticks_us()
+
+
+class Options:
+    def __init__(self, argv):
+        self.seconds = 4.0
+        self.presses = []
+        self.midi = False
+        self.frames = False
+        self.second_core = True
+        i = 0
+        while i < len(argv):
+            arg = argv[i]
+            if arg == "--seconds":
+                i += 1
+                self.seconds = float(argv[i])
+            elif arg == "--press":
+                i += 1
+                self.presses.append(parse_press(argv[i]))
+            elif arg == "--midi":
+                self.midi = True
+            elif arg == "--frames":
+                self.frames = True
+            elif arg == "--one-core":
+                self.second_core = False
+            else:
+                print("unknown option", arg)
+                sys.exit(2)
+            i += 1
+
+
+def parse_press(text):
+    # KEY@START[+HOLD], times in seconds
+    key, _, timing = text.partition("@")
+    start, _, hold = timing.partition("+")
+    start = float(start or 0)
+    return int(key), int(start * 1000), int((start + float(hold or 0.05)) * 1000)
+
+
+class Keypad:
+    # the picokeypad calls seq.py makes
+    def __init__(self):
+        self.presses = []
+        self.start = time.ticks_ms()
+        self.pixels = bytearray(16 * 3)
+        self.frames = 0
+        self.writes = 0
+        self.reads = 0
+        self.show = False
+    
+    def play(self, presses):
+        global started
+        
+        # (key, start, end) in milliseconds from now
+        self.presses = presses
+        self.start = time.ticks_ms()
+        started = time.ticks_us()
+    
+    def init(self):
+        pass
+    
+    def set_brightness(self, brightness):
+        pass
+    
+    def get_num_pads(self):
+        return 16
+    
+    def get_button_states(self):
+        self.reads += 1
+        now = time.ticks_diff(time.ticks_ms(), self.start)
+        states = 0
+        for key, start, end in self.presses:
+            if start <= now < end:
+                states |= 1 << key
+        return states
+    
+    def illuminate(self, i, r, g, b):
+        self.writes += 1
+        self.pixels[i * 3] = r
+        self.pixels[i * 3 + 1] = g
+        self.pixels[i * 3 + 2] = b
+    
+    def update(self):
+        self.frames += 1
+        if self.show:
+            pixels = self.pixels
+            print("{:10.6f}  {}".format(elapsed(), [tuple(pixels[i:i + 3]) for i in range(0, 48, 3)]))
+
+
+class Midi:
+    # counts what would have gone out of the uart, printing each message
+    # when asked the same way python -m sim does
+    def __init__(self):
+        self.bytes = 0
+        self.writes = 0
+        self.messages = 0
+        self.show = False
+    
+    def write(self, data):
+        self.writes += 1
+        self.bytes += len(data)
+        i = 0
+        while i < len(data):
+            status = data[i]
+            length = 1 if status >= 0xF0 else 3
+            self.messages += 1
+            if self.show:
+                if length == 1:
+                    print("{:10.6f}  {:02x}  ".format(elapsed(), status))
+                else:
+                    print("{:10.6f}  {:02x} {} {}".format(elapsed(), status, data[i + 1], data[i + 2]))
+            i += length
+        return len(data)
+
+
+def elapsed():
+    return time.ticks_diff(time.ticks_us(), started) / 1000000
+
+
+def report(keypad, midi, ticks, max_lateness, dropped_steps):
+    print("steps: {}, max late: {}us, dropped: {}".format(ticks, max_lateness, dropped_steps))
+    print("midi: {} messages, {} bytes in {} writes".format(midi.messages, midi.bytes, midi.writes))
+    print("leds: {} frames, {} pixel writes".format(keypad.frames, keypad.writes))
+    print("buttons: {} reads".format(keypad.reads))
@@ -0,0 +1,713 @@
+# midi step sequencer for the pimoroni rgb keypad on micropython
+# a port of seq3.py for pimoroni's micropython build, which has the picokeypad
+# module. the step playing and led frame building are compiled to machine
+# code with micropython's native and viper emitters, and the step clock runs
+# on the pico's second core, neither of which circuitpython can do
+# micropython has no usb midi so it goes out of uart 0 at 31250 baud on GP0,
+# wire up a midi out socket or a uart to midi board there
+# copy across as main.py to run it at power up
+# it has seq3.py's pattern editing, lengths, velocities, accents, tempo and
+# midi clock out, but not the saving, songs, swing, nudges, gates or clock in
+# serial midi only carries about 3 bytes a millisecond, so a step can't hold
+# much more than a hundred messages before it holds the clock up
+# on micropython's unix port it runs against host.py instead, see there
+
+import micropython
+import sys
+import time
+import _thread
+from array import array
+from micropython import const
+
+if sys.platform == "rp2":
+    import picokeypad as keypad
+    from machine import Pin, UART
+    midi_out = UART(0, baudrate=31250, tx=Pin(0), rx=Pin(1))
+else:
+    import host
+    keypad = host.Keypad()
+    midi_out = host.Midi()
+
+
+CHANNELS = const(16)
+NOTES = const(16)
+STEPS = const(64)
+FIRST_NOTE = const(36)
+
+
+# enums
+class ButtonState:
+    PRESSED = 1
+    LONGPRESSED = 2
+    RELEASED = 3
+
+
+class ButtonMode:
+    PATTERN = 1
+    NOTE_CHOOSER = 2
+    CHANNEL_CHOOSER = 3
+    LENGTH_CHOOSER = 4
+    VIEW_CHOOSER = 5
+    TEMPO_CHOOSER = 6
+    WAIT = 9
+
+
+class Lane:
+    NOTES = 1
+    VELOCITY = 2
+    ACCENT = 3
+
+
+class Color:
+    KICK = (127, 0, 0)
+    SNARE = (0, 127, 0)
+    CLAP = (127, 0, 127)
+    HIHAT = (0, 127, 127)
+    TOM = (127, 63, 0)
+    CYMBOL = (0, 0, 192)
+    
+    MAJOR = (0, 0, 192)
+    SCALE = (0, 63, 63)
+    ACCIDENTAL = (63, 0, 63)
+    
+    CHANNEL = (127, 127, 0)
+    DRUM_CHANNEL = (0, 127, 0)
+    
+    LENGTH = (127, 63, 0)
+    PAGE = (0, 63, 127)
+    LANE = (0, 31, 63)
+    VELOCITY = (255, 127, 0)
+    ACCENT = (255, 0, 0)
+    TEMPO = (127, 0, 63)
+    
+    MARKER = (16, 16, 16)
+    NOTE = (255, 255, 255)
+    NOTE_OFF = (7, 0, 0)
+    OFF = (0, 0, 0)
+
+
+class Note:
+    OFF = 0
+    ON = 1
+    HOLD = 2
+
+
+class Gestures:
+    # turns the raw key states into presses, releases and long presses that
+    # each fire once, like seq3.py's without the double taps and chords
+    def __init__(self, handler, keys=16, debounce=5, long_press=500):
+        self.handler = handler
+        self.debounce = debounce
+        self.long_press = long_press
+        self.raw = 0
+        self.states = 0
+        self.long_pressed = 0
+        self.changed_times = array('l', [0] * keys)
+        self.pressed_times = array('l', [0] * keys)
+    
+    def update(self, raw, now, report=True):
+        changed = raw ^ self.raw
+        self.raw = raw
+        active = raw | changed | self.states
+        i = 0
+        while active >> i:
+            bit = 1 << i
+            if changed & bit:
+                self.changed_times[i] = now
+            elif (raw ^ self.states) & bit:
+                if time.ticks_diff(now, self.changed_times[i]) >= self.debounce:
+                    if raw & bit:
+                        self.states |= bit
+                        self.pressed_times[i] = now
+                        if report:
+                            self.handler(i, ButtonState.PRESSED)
+                    else:
+                        self.states &= ~bit
+                        self.long_pressed &= ~bit
+                        if report:
+                            self.handler(i, ButtonState.RELEASED)
+            elif self.states & ~self.long_pressed & bit:
+                if time.ticks_diff(now, self.pressed_times[i]) >= self.long_press:
+                    self.long_pressed |= bit
+                    if report:
+                        self.handler(i, ButtonState.LONGPRESSED)
+            i += 1
+
+
+def dim_color(color, amount=0.1):
+    return tuple([int(amount * value) for value in color])
+
+
+# the pattern is kept in module level buffers rather than a class, as the
+# emitters get at them directly with ptr8 and ptr16, laid out as seq3.py's
+# pattern with the notes on or sounding at each step as bitmasks
+lengths = bytearray([16] * CHANNELS)
+on_masks = array('H', [0] * (CHANNELS * STEPS))
+held_masks = array('H', [0] * (CHANNELS * STEPS))
+velocity_levels = bytearray([8, 16, 24, 32, 40, 48, 56, 64, 72, 80, 88, 96, 104, 112, 120, 127])
+default_velocity_level = 14
+accent_boost = 24
+# from a single repeated byte rather than an 8192 item list, as in seq3.py
+velocities = bytearray(bytes([default_velocity_level * 17]) * (CHANNELS * STEPS * NOTES // 2))
+accents = bytearray(CHANNELS * STEPS // 8)
+
+# state
+step = 0
+note = 0
+channel = 9
+page = 0
+lane = Lane.NOTES
+
+# what the clock has played, only the clock's core writes these
+channel_steps = bytearray(CHANNELS)
+sounding = array('H', [0] * CHANNELS)
+midi_buffer = bytearray(CHANNELS * NOTES * 3 * 2)
+midi_view = memoryview(midi_buffer)
+
+button_map = [12, 13, 14, 15, 8, 9, 10, 11, 4, 5, 6, 7, 0, 1, 2, 3]
+
+velocity_choices = [14, 9, 5, 15]
+tempo_choices = [60, 70, 80, 90, 100, 110, 120, 130, 140, 150, 160, 170, 180, 190, 200, 210]
+next_melody_note = [Note.ON, Note.HOLD, Note.OFF]
+next_drum_note = [Note.ON, Note.OFF]
+
+drum_note_colors = [Color.KICK, Color.SNARE, Color.SNARE, Color.CLAP,
+                    Color.SNARE, Color.TOM, Color.HIHAT, Color.TOM,
+                    Color.HIHAT, Color.TOM, Color.HIHAT, Color.TOM,
+                    Color.TOM, Color.CYMBOL, Color.TOM, Color.CYMBOL]
+note_dimmed_colors = [dim_color(color) for color in drum_note_colors]
+melody_note_colors = [Color.MAJOR, Color.ACCIDENTAL, Color.SCALE, Color.ACCIDENTAL,
+                      Color.MAJOR, Color.SCALE, Color.ACCIDENTAL, Color.MAJOR,
+                      Color.ACCIDENTAL, Color.SCALE, Color.ACCIDENTAL, Color.SCALE,
+                      Color.MAJOR, Color.ACCIDENTAL, Color.SCALE, Color.ACCIDENTAL]
+melody_hold_note_colors = [dim_color(color) for color in melody_note_colors]
+velocity_colors = [dim_color(Color.VELOCITY, (level + 1) / 16) for level in range(16)]
+dim_notes = [False] * 16
+
+# the pattern view's colours by what's on each step: past the end, empty,
+# on, held, on under the playhead and anything else under it
+palette = bytearray(6 * 3)
+led_frame = bytearray(16 * 3)
+shown_step = -1
+leds_due = True
+
+button_mode = ButtonMode.PATTERN
+
+# timing, in microseconds as micropython's ticks are
+step_length = 105000
+tick = 0
+report_timing = False
+lateness = 0
+max_lateness = 0
+total_lateness = 0
+dropped_steps = 0
+running = True
+clock_stopped = False
+
+send_clock = True
+clock_message = bytes([0xF8])
+start_message = bytes([0xFA])
+stop_message = bytes([0xFC])
+
+
+def get_note(_channel, _note, _step):
+    bit = 1 << _note
+    index = _channel * STEPS + _step
+    if on_masks[index] & bit:
+        return Note.ON
+    if held_masks[index] & bit:
+        return Note.HOLD
+    return Note.OFF
+
+
+def set_note(_channel, _note, _step, value):
+    bit = 1 << _note
+    index = _channel * STEPS + _step
+    if value == Note.ON:
+        on_masks[index] |= bit
+    else:
+        on_masks[index] &= ~bit
+    if value == Note.OFF:
+        held_masks[index] &= ~bit
+    else:
+        held_masks[index] |= bit
+
+
+def get_velocity(_channel, _note, _step):
+    index = (_channel * STEPS + _step) * NOTES + _note
+    return velocities[index >> 1] >> ((index & 1) << 2) & 15
+
+
+def set_velocity(_channel, _note, _step, level):
+    index = (_channel * STEPS + _step) * NOTES + _note
+    shift = (index & 1) << 2
+    velocities[index >> 1] = velocities[index >> 1] & ~(15 << shift) | level << shift
+
+
+def accented(_channel, _step):
+    index = _channel * STEPS + _step
+    return accents[index >> 3] >> (index & 7) & 1
+
+
+def set_accent(_channel, _step, accent):
+    index = _channel * STEPS + _step
+    if accent:
+        accents[index >> 3] |= 1 << (index & 7)
+    else:
+        accents[index >> 3] &= ~(1 << (index & 7))
+
+
+def clear_pattern():
+    # whatever is sounding gets its note off on the next step, as nothing's
+    # held any more
+    for i in range(CHANNELS):
+        lengths[i] = 16
+    for i in range(CHANNELS * STEPS):
+        on_masks[i] = 0
+        held_masks[i] = 0
+    for i in range(len(velocities)):
+        velocities[i] = default_velocity_level * 17
+    for i in range(len(accents)):
+        accents[i] = 0
+
+
+@micropython.native
+def advance(_tick):
+    # each channel loops over its own length
+    for _channel in range(CHANNELS):
+        channel_steps[_channel] = _tick % lengths[_channel]
+
+
+@micropython.viper
+def fill_step(steps, out) -> int:
+    # writes every channel's note offs and then note ons for the given steps
+    # into out as midi bytes, returning how many. notes are turned off once
+    # they're no longer held, so a step played out of turn or a pattern
+    # cleared under it still leaves nothing hanging
+    s = ptr8(steps)
+    o = ptr8(out)
+    on_ptr = ptr16(on_masks)
+    held_ptr = ptr16(held_masks)
+    sounding_ptr = ptr16(sounding)
+    velocity_ptr = ptr8(velocities)
+    accent_ptr = ptr8(accents)
+    levels = ptr8(velocity_levels)
+    boost = int(accent_boost)
+    n = 0
+    for _channel in range(CHANNELS):
+        index = _channel * STEPS + s[_channel]
+        on = on_ptr[index]
+        held = held_ptr[index]
+        off = sounding_ptr[_channel] & ~held
+        sounding_ptr[_channel] = sounding_ptr[_channel] & held | on
+        if off:
+            for _note in range(NOTES):
+                if off & (1 << _note):
+                    o[n] = 0x80 | _channel
+                    o[n + 1] = FIRST_NOTE + _note
+                    o[n + 2] = 120
+                    n += 3
+        if on:
+            added = 0
+            if accent_ptr[index >> 3] & (1 << (index & 7)):
+                added = boost
+            first = index * NOTES
+            for _note in range(NOTES):
+                if on & (1 << _note):
+                    packed = first + _note
+                    velocity = levels[velocity_ptr[packed >> 1] >> ((packed & 1) << 2) & 15] + added
+                    if velocity > 127:
+                        velocity = 127
+                    o[n] = 0x90 | _channel
+                    o[n + 1] = FIRST_NOTE + _note
+                    o[n + 2] = velocity
+                    n += 3
+    return n
+
+
+@micropython.viper
+def build_pattern_frame(frame, colors, first: int, playing: int) -> int:
+    # the pattern view's colours written into the frame, returning a mask of
+    # the keys that are different
+    f = ptr8(frame)
+    p = ptr8(colors)
+    on_ptr = ptr16(on_masks)
+    held_ptr = ptr16(held_masks)
+    _channel = int(channel)
+    bit = 1 << int(note)
+    length = ptr8(lengths)[_channel]
+    base = _channel * STEPS
+    changed = 0
+    for i in range(16):
+        _step = first + i
+        if _step >= length:
+            kind = 0
+        elif on_ptr[base + _step] & bit:
+            kind = 2
+            if _step == playing:
+                kind = 4
+        elif _step == playing:
+            kind = 5
+        elif held_ptr[base + _step] & bit:
+            kind = 3
+        else:
+            kind = 1
+        j = i * 3
+        k = kind * 3
+        if f[j] != p[k] or f[j + 1] != p[k + 1] or f[j + 2] != p[k + 2]:
+            f[j] = p[k]
+            f[j + 1] = p[k + 1]
+            f[j + 2] = p[k + 2]
+            changed |= 1 << i
+    return changed
+
+
+def set_palette():
+    if channel == 9:
+        colors = [Color.OFF, Color.OFF, drum_note_colors[note], Color.OFF, Color.NOTE, Color.MARKER]
+    else:
+        colors = [Color.OFF, Color.NOTE_OFF, melody_note_colors[note], melody_hold_note_colors[note],
+                  Color.NOTE, Color.MARKER]
+    for i in range(6):
+        palette[i * 3:i * 3 + 3] = bytes(colors[i])
+
+
+def set_led(index, color):
+    # returns the key's bit if it's different
+    j = index * 3
+    if led_frame[j] == color[0] and led_frame[j + 1] == color[1] and led_frame[j + 2] == color[2]:
+        return 0
+    led_frame[j] = color[0]
+    led_frame[j + 1] = color[1]
+    led_frame[j + 2] = color[2]
+    return 1 << index
+
+
+@micropython.native
+def build_frame():
+    # everything besides the pattern view is only up while choosing
+    changed = 0
+    length = lengths[channel]
+    if button_mode == ButtonMode.PATTERN and lane == Lane.NOTES:
+        set_palette()
+        changed = build_pattern_frame(led_frame, palette, page * 16, step)
+    elif button_mode == ButtonMode.PATTERN:
+        for i in range(16):
+            _step = page * 16 + i
+            if _step >= length:
+                color = Color.OFF
+            elif _step == step:
+                color = Color.NOTE
+            elif lane == Lane.VELOCITY:
+                if get_note(channel, note, _step) == Note.ON:
+                    color = velocity_colors[get_velocity(channel, note, _step)]
+                else:
+                    color = Color.NOTE_OFF
+            else:
+                color = Color.ACCENT if accented(channel, _step) else Color.NOTE_OFF
+            changed |= set_led(i, color)
+    elif button_mode == ButtonMode.NOTE_CHOOSER:
+        for i in range(16):
+            if channel == 9:
+                if dim_notes[i]:
+                    changed |= set_led(i, drum_note_colors[button_map[i]])
+                else:
+                    changed |= set_led(i, note_dimmed_colors[button_map[i]])
+            else:
+                changed |= set_led(i, melody_note_colors[button_map[i]])
+    elif button_mode == ButtonMode.CHANNEL_CHOOSER:
+        for i in range(16):
+            changed |= set_led(i, Color.DRUM_CHANNEL if button_map[i] == 9 else Color.CHANNEL)
+    elif button_mode == ButtonMode.LENGTH_CHOOSER:
+        for i in range(16):
+            changed |= set_led(i, Color.LENGTH if page * 16 + i < length else Color.NOTE_OFF)
+    elif button_mode == ButtonMode.VIEW_CHOOSER:
+        # pages along the top row and lanes on the next
+        pages = (length + 15) // 16
+        for i in range(16):
+            if i == page or i == lane + 3:
+                changed |= set_led(i, Color.NOTE)
+            elif i < pages:
+                changed |= set_led(i, Color.PAGE)
+            elif i < 4:
+                changed |= set_led(i, Color.NOTE_OFF)
+            elif i < 7:
+                changed |= set_led(i, Color.LANE)
+            else:
+                changed |= set_led(i, Color.OFF)
+    elif button_mode == ButtonMode.TEMPO_CHOOSER:
+        bpm = 15000000 // step_length
+        for i in range(16):
+            changed |= set_led(i, Color.TEMPO if tempo_choices[button_map[i]] <= bpm else Color.NOTE_OFF)
+    return changed
+
+
+def update_leds():
+    changed = build_frame()
+    if not changed:
+        return
+    # the keypad sends the whole chain out on update whatever's changed
+    for i in range(16):
+        if changed & (1 << i):
+            j = i * 3
+            keypad.illuminate(i, led_frame[j], led_frame[j + 1], led_frame[j + 2])
+    keypad.update()
+
+
+def button_press(index, state):
+    global note
+    global channel
+    global page
+    global lane
+    global button_mode
+    global leds_due
+    
+    leds_due = True
+    if button_mode == ButtonMode.NOTE_CHOOSER:
+        if state == ButtonState.PRESSED:
+            note = button_map[index]
+            button_mode = ButtonMode.WAIT
+    elif button_mode == ButtonMode.CHANNEL_CHOOSER:
+        if state == ButtonState.PRESSED:
+            note = 0
+            channel = button_map[index]
+            button_mode = ButtonMode.WAIT
+    elif button_mode == ButtonMode.LENGTH_CHOOSER:
+        if state == ButtonState.PRESSED:
+            lengths[channel] = page * 16 + index + 1
+            button_mode = ButtonMode.WAIT
+    elif button_mode == ButtonMode.VIEW_CHOOSER:
+        if state == ButtonState.PRESSED and index < 4:
+            page = index
+            button_mode = ButtonMode.WAIT
+        elif state == ButtonState.PRESSED and index < 7:
+            lane = index - 3
+            button_mode = ButtonMode.WAIT
+    elif button_mode == ButtonMode.TEMPO_CHOOSER:
+        if state == ButtonState.PRESSED:
+            set_tempo(tempo_choices[button_map[index]])
+            button_mode = ButtonMode.WAIT
+    elif button_mode == ButtonMode.PATTERN:
+        if index == 15:
+            if state == ButtonState.LONGPRESSED:
+                for i in range(16):
+                    dim_notes[i] = any(get_note(channel, button_map[i], _step) == Note.ON for _step in range(STEPS))
+                button_mode = ButtonMode.NOTE_CHOOSER
+            elif state == ButtonState.RELEASED:
+                press_step(index)
+        elif index == 12:
+            if state == ButtonState.LONGPRESSED:
+                button_mode = ButtonMode.CHANNEL_CHOOSER
+            elif state == ButtonState.RELEASED:
+                press_step(index)
+        elif index == 0:
+            if state == ButtonState.LONGPRESSED:
+                button_mode = ButtonMode.LENGTH_CHOOSER
+            elif state == ButtonState.RELEASED:
+                press_step(index)
+        elif index == 1:
+            if state == ButtonState.LONGPRESSED:
+                button_mode = ButtonMode.VIEW_CHOOSER
+            elif state == ButtonState.RELEASED:
+                press_step(index)
+        elif index == 2:
+            if state == ButtonState.LONGPRESSED:
+                button_mode = ButtonMode.TEMPO_CHOOSER
+            elif state == ButtonState.RELEASED:
+                press_step(index)
+        elif index == 3 and state == ButtonState.LONGPRESSED:
+            reset()
+        else:
+            if state == ButtonState.PRESSED:
+                press_step(index)
+
+
+def press_step(index):
+    _step = page * 16 + index
+    if _step >= lengths[channel]:
+        return
+    
+    if lane == Lane.NOTES:
+        current = get_note(channel, note, _step)
+        if channel == 9:
+            set_note(channel, note, _step, next_drum_note[current])
+        else:
+            set_note(channel, note, _step, next_melody_note[current])
+    elif lane == Lane.VELOCITY:
+        if get_note(channel, note, _step) != Note.ON:
+            return
+        level = get_velocity(channel, note, _step)
+        if level in velocity_choices:
+            level = velocity_choices[(velocity_choices.index(level) + 1) % len(velocity_choices)]
+        else:
+            level = velocity_choices[0]
+        set_velocity(channel, note, _step, level)
+    else:
+        set_accent(channel, _step, not accented(channel, _step))
+
+
+def reset():
+    global note
+    global channel
+    global page
+    
+    note = 0
+    channel = 9
+    page = 0
+    clear_pattern()
+
+
+def set_tempo(bpm):
+    global step_length
+    
+    # the clock picks it up from the next step, 4 steps to the beat
+    step_length = 15000000 // bpm
+
+
+def all_notes_off():
+    # for when what's sounding isn't known
+    for _channel in range(CHANNELS):
+        for _note in range(NOTES):
+            midi_out.write(bytes([0x80 | _channel, FIRST_NOTE + _note, 120]))
+
+
+@micropython.native
+def wait_until(deadline, poll):
+    # poll gets a look in every millisecond or so while there's plenty left,
+    # then it's slept off to the last millisecond, which is spun as sleep_us
+    # can oversleep
+    while time.ticks_diff(deadline, time.ticks_us()) > 3000:
+        if poll is None:
+            break
+        poll()
+        time.sleep_us(1000)
+    remaining = time.ticks_diff(deadline, time.ticks_us())
+    if remaining > 1500:
+        time.sleep_us(remaining - 1000)
+    while time.ticks_diff(deadline, time.ticks_us()) > 0:
+        pass
+
+
+@micropython.native
+def clock_loop(poll=None):
+    global tick
+    global lateness
+    global max_lateness
+    global total_lateness
+    global dropped_steps
+    global clock_stopped
+    
+    # each step's time is added on from the last step's deadline rather than
+    # when it actually went, so nothing drifts, and the ticks only ever need
+    # a step's difference as they wrap
+    deadline = time.ticks_us()
+    if send_clock:
+        midi_out.write(start_message)
+    while running:
+        length = step_length
+        late = time.ticks_diff(time.ticks_us(), deadline)
+        if late >= length:
+            # skip any steps we've completely missed instead of playing catch up
+            missed = late // length
+            dropped_steps += missed
+            tick += missed
+            deadline = time.ticks_add(deadline, missed * length)
+            late -= missed * length
+        lateness = late
+        total_lateness += late
+        if late > max_lateness:
+            max_lateness = late
+        
+        # the step's first pulse goes out ahead of its notes
+        if send_clock:
+            midi_out.write(clock_message)
+        advance(tick)
+        count = fill_step(channel_steps, midi_buffer)
+        if count:
+            midi_out.write(midi_view[:count])
+        tick += 1
+        if report_timing and tick % 16 == 0:
+            print_timing()
+        
+        # 24 pulses per quarter note makes 6 per 16th note step
+        if send_clock:
+            for pulse in range(1, 6):
+                wait_until(time.ticks_add(deadline, pulse * length // 6), poll)
+                midi_out.write(clock_message)
+        deadline = time.ticks_add(deadline, length)
+        wait_until(deadline, poll)
+    
+    if send_clock:
+        midi_out.write(stop_message)
+    clock_stopped = True
+
+
+def print_timing():
+    print("tick: {}, late: {}us, max: {}us, mean: {}us, dropped: {}".format(
+        tick, lateness, max_lateness, total_lateness // max(tick, 1), dropped_steps))
+
+
+gestures = Gestures(button_press)
+started = 0
+run_for = None
+
+
+def ui_poll():
+    global step
+    global button_mode
+    global shown_step
+    global leds_due
+    global running
+    
+    now = time.ticks_ms()
+    if run_for is not None and time.ticks_diff(now, started) >= run_for:
+        running = False
+    
+    # nothing is reported while waiting for every button to be let go
+    waiting = button_mode == ButtonMode.WAIT
+    gestures.update(keypad.get_button_states(), now, not waiting)
+    if waiting and not gestures.states:
+        button_mode = ButtonMode.PATTERN
+        leds_due = True
+    
+    # the step shown is the current channel's last played
+    step = channel_steps[channel]
+    if leds_due or step != shown_step:
+        shown_step = step
+        leds_due = False
+        update_leds()
+
+
+def main(seconds=None, second_core=True):
+    global started
+    global run_for
+    
+    keypad.init()
+    keypad.set_brightness(0.5)
+    # midi panic for script reloading
+    all_notes_off()
+    
+    started = time.ticks_ms()
+    run_for = None if seconds is None else int(seconds * 1000)
+    if second_core:
+        # the clock gets a core to itself and the keys and leds have the other
+        _thread.start_new_thread(clock_loop, ())
+        while running:
+            ui_poll()
+            time.sleep_ms(2)
+        while not clock_stopped:
+            time.sleep_ms(1)
+    else:
+        clock_loop(ui_poll)
+
+
+if __name__ == "__main__":
+    if sys.platform == "rp2":
+        main()
+    else:
+        options = host.Options(sys.argv[1:])
+        keypad.play(options.presses)
+        keypad.show = options.frames
+        midi_out.show = options.midi
+        main(options.seconds, options.second_core)
+        host.report(keypad, midi_out, tick, max_lateness, dropped_steps)
@@ -0,0 +1,153 @@
+# the boards seq3.py runs on, each giving it the same few batched operations
+# so the sequencer itself never touches the hardware:
+# - read_keys() returns a bitmask of the keys held down
+# - keys_changed() says whether they could have changed since the last read
+# - write_frame(frame, changed) lights the leds from a list of 16 colours,
+#   where changed is a bitmask of the ones that are different
+# - midi_in and midi_out are the usb midi ports
+# boot.py only needs the keys, which boot_keys() reads without setting up the
+# rest, as usb midi isn't there until code.py runs
+# copy this across alongside code.py
+# requires the following libs:
+# - adafruit_bus_device and adafruit_dotstar for the pico rgb keypad
+# - keybow2040 for the keybow 2040
+
+import board
+import usb_midi
+
+
+class Backend:
+    # usb midi is the same whatever the board
+    def __init__(self):
+        self.midi_in = usb_midi.ports[0]
+        self.midi_out = usb_midi.ports[1]
+    
+    def keys_changed(self):
+        return True
+    
+    @staticmethod
+    def boot_keys():
+        return 0
+
+
+class RgbKeypad(Backend):
+    # pimoroni pico rgb keypad, the buttons are on a tca9555 expander over i2c
+    # and the leds are a chain of dotstars on spi
+    def __init__(self, interrupt_pin=None):
+        super().__init__()
+        import adafruit_dotstar
+        import busio
+        from adafruit_bus_device.i2c_device import I2CDevice
+        from digitalio import DigitalInOut, Direction, Pull
+        
+        self.cs = DigitalInOut(board.GP17)
+        self.cs.direction = Direction.OUTPUT
+        self.cs.value = 0
+        self.pixels = adafruit_dotstar.DotStar(board.GP18, board.GP19, 16,
+                                               brightness=0.5, auto_write=False)
+        self.i2c = busio.I2C(board.GP5, board.GP4)
+        self.device = I2CDevice(self.i2c, 0x20)
+        self.command = bytes([0x0])
+        self.result = bytearray(2)
+        # the expander pulls its interrupt line low when a button changes, so
+        # if it's wired up the buttons only need reading when there's news
+        self.interrupt = None
+        if interrupt_pin is not None:
+            self.interrupt = DigitalInOut(interrupt_pin)
+            self.interrupt.direction = Direction.INPUT
+            self.interrupt.pull = Pull.UP
+    
+    def keys_changed(self):
+        return self.interrupt is None or not self.interrupt.value
+    
+    @staticmethod
+    def boot_keys():
+        # just the expander, the bus is let go again for code.py
+        import busio
+        from adafruit_bus_device.i2c_device import I2CDevice
+        
+        i2c = busio.I2C(board.GP5, board.GP4)
+        device = I2CDevice(i2c, 0x20)
+        result = bytearray(2)
+        with device:
+            device.write(bytes([0x0]))
+            device.readinto(result)
+        i2c.deinit()
+        return ~(result[0] | result[1] << 8) & 0xFFFF
+    
+    def read_keys(self):
+        # the buttons read low on the expander, and reading also clears its
+        # interrupt
+        with self.device:
+            self.device.write(self.command)
+            self.device.readinto(self.result)
+        return ~(self.result[0] | self.result[1] << 8) & 0xFFFF
+    
+    def write_frame(self, frame, changed):
+        # only the changed pixels are set but the whole chain goes out at once
+        for i in range(16):
+            if changed & (1 << i):
+                self.pixels[i] = frame[i]
+        self.pixels.show()
+
+
+class Keybow(Backend):
+    # pimoroni keybow 2040, the keys are gpio pins so reading them is cheap,
+    # the leds are on an is31fl3731 over i2c and set one key at a time
+    def __init__(self):
+        super().__init__()
+        from keybow2040 import Keybow2040
+        
+        self.keybow = Keybow2040(board.I2C())
+        self.keys = self.keybow.keys
+    
+    @staticmethod
+    def boot_keys():
+        # the keys are pins pulled up, low when pressed, so there's no need
+        # to start the led driver
+        from digitalio import DigitalInOut, Pull
+        
+        states = 0
+        for i in range(16):
+            key = DigitalInOut(getattr(board, "SW" + str(i)))
+            key.pull = Pull.UP
+            if not key.value:
+                states |= 1 << i
+            key.deinit()
+        return states
+    
+    def read_keys(self):
+        # straight from the keys rather than get_states() building a list
+        states = 0
+        for i in range(16):
+            if self.keys[i].get_state():
+                states |= 1 << i
+        return states
+    
+    def write_frame(self, frame, changed):
+        for i in range(16):
+            if changed & (1 << i):
+                self.keys[i].set_led(*frame[i])
+        self.keybow.update()
+
+
+def detect(interrupt_pin=None):
+    # picks the backend for whichever board this is running on
+    board_id = getattr(board, "board_id", "")
+    if "keybow" in board_id:
+        return Keybow()
+    if board_id == "host":
+        # the simulator provides its own
+        import host_backend
+        return host_backend.Backend()
+    return RgbKeypad(interrupt_pin)
+
+
+def boot_keys():
+    # the keys held down, for boot.py
+    board_id = getattr(board, "board_id", "")
+    if "keybow" in board_id:
+        return Keybow.boot_keys()
+    if board_id == "host":
+        return Backend.boot_keys()
+    return RgbKeypad.boot_keys()
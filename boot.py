@@ -0,0 +1,13 @@
+# runs before code.py, lets seq3.py save its patterns to the drive
+# circuitpython only lets one side write to the drive at a time, so this
+# hands it to the code and the computer sees it as read only. hold the top
+# left button while plugging in to leave it writable from the computer, to
+# copy a new code.py across for instance
+# needs backends.py and the libs for the board, see there
+
+import storage
+
+import backends
+
+keys = backends.boot_keys()
+storage.remount("/", readonly=bool(keys & 1))
@@ -4,12 +4,14 @@ import random
 
 import usb_midi
 import adafruit_midi
-from adafruit_midi.note_on import NoteOn
-from adafruit_midi.note_off import NoteOff
 from adafruit_midi.control_change import ControlChange
 
 midi = adafruit_midi.MIDI(midi_out=usb_midi.ports[1], out_channel=0)
 
+# C2 on the output channel, encoded up front so playing a step doesn't allocate
+note_on_message = bytes((0x90 | midi.out_channel, 36, 120))
+note_off_message = bytes((0x80 | midi.out_channel, 36, 120))
+
 print("Midi test")
 
 # Convert channel numbers at the presentation layer to the ones musicians use
@@ -68,8 +70,8 @@ while True:
     step = (step + 1) % 16
     if note1[step]:
         pixels[step] = rgb_note
-        midi.send(NoteOn("C2", 120))
+        usb_midi.ports[1].write(note_on_message)
     else:
         pixels[step] = rgb_marker
-        midi.send(NoteOff("C2", 120))
+        usb_midi.ports[1].write(note_off_message)
     wait(0.125)
\ No newline at end of file
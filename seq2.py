@@ -3,7 +3,6 @@
 # requires the following libs:
 # - adafruit_bus_device
 # - adafruit_dotstar
-# - adafruit_midi
 
 import board
 import time
@@ -19,9 +18,6 @@ from adafruit_bus_device.i2c_device import I2CDevice
 
 # midi comms
 import usb_midi
-import adafruit_midi
-from adafruit_midi.note_on import NoteOn
-from adafruit_midi.note_off import NoteOff
 
 
 # led setup
@@ -36,7 +32,7 @@ i2c = busio.I2C(board.GP5, board.GP4)
 device = I2CDevice(i2c, 0x20)
 
 # midi setup
-midi = adafruit_midi.MIDI(midi_out=usb_midi.ports[1], out_channel=9)
+midi = usb_midi.ports[1]
 
 
 # enums
@@ -81,24 +77,23 @@ note_colors = [Color.KICK, Color.SNARE, Color.SNARE, Color.CLAP,
 note_dimmed_colors = [dim_color(color) for color in note_colors]
 dim_notes = [False] * 16
 
+# messages are encoded up front so playing a step doesn't allocate
+note_on_messages = [bytes((0x99, 36 + i, 120)) for i in range(16)]
+note_off_messages = [bytes((0x89, 36 + i, 120)) for i in range(16)]
+
 button_mode = ButtonMode.PATTERN
-last_button_states = [0] * 16
+last_button_states = 0
 last_button_pressed_times = [None] * 16
+button_command = bytes([0x0])
+button_result = bytearray(2)
 
 
 def read_button_states():
-    pressed = [0] * 16
+    # returns a bitmask of the pressed buttons, which read low on the expander
     with device:
-        device.write(bytes([0x0]))
-        result = bytearray(2)
-        device.readinto(result)
-        b = result[0] | result[1] << 8
-        for i in range(16):
-            if not (1 << i) & b:
-                pressed[i] = 1
-            else:
-                pressed[i] = 0
-    return pressed
+        device.write(button_command)
+        device.readinto(button_result)
+    return ~(button_result[0] | button_result[1] << 8) & 0xFFFF
 
 
 def wait(delay):
@@ -113,19 +108,25 @@ def wait(delay):
         button_states = read_button_states()
         
         if button_mode == ButtonMode.WAIT:
-            if all(state == 0 for state in button_states):
+            if not button_states:
                 button_mode = ButtonMode.PATTERN
         else:
-            for i in range(16):
-                if button_states[i] == 1 and last_button_states[i] == 0:
+            changed = button_states ^ last_button_states
+            # only visit buttons that are down or have just been released
+            active = button_states | last_button_states
+            i = 0
+            while active >> i:
+                bit = 1 << i
+                if changed & button_states & bit:
                     last_button_pressed_times[i] = now
                     button_press(i, ButtonState.PRESSED)
-                elif button_states[i] == 1:
+                elif button_states & bit:
                     if last_button_pressed_times[i] + 0.5 < now:
                         button_press(i, ButtonState.LONGPRESSED)
-                elif button_states[i] == 0 and last_button_states[i] == 1:
+                elif changed & bit:
                     button_press(i, ButtonState.RELEASED)
                     last_button_pressed_times[i] = None
+                i += 1
         
         last_button_states = button_states
         time.sleep(0.001)
@@ -159,18 +160,18 @@ def button_press(index, state):
 def play_notes(step):
     for i in range(16):
         if pattern[i][step]:
-            midi.send(NoteOn(36 + i, 120))
+            midi.write(note_on_messages[i])
 
 
 def stop_notes(step):
     for i in range(16):
         if pattern[i][step]:
-            midi.send(NoteOff(36 + i, 120))
+            midi.write(note_off_messages[i])
 
 
 def reset_notes():
     for i in range(16):
-        midi.send(NoteOff(36 + i, 120))
+        midi.write(note_off_messages[i])
 
 
 def reset():
@@ -1,43 +1,43 @@
 # usb midi step sequencer for raspberry pi pico
-# works with the pimoroni rgb keypad
-# written for circuitpython v6.2.0
+# works with the pimoroni rgb keypad and the keybow 2040
+# written for circuitpython v7.1.0 or later, which asyncio and board.board_id need
 # requires the following libs:
-# - adafruit_bus_device
-# - adafruit_dotstar
-# - adafruit_midi
+# - asyncio
+# - adafruit_ticks
+# and whichever the board needs from backends.py, which is copied across too
+# copy boot.py across as well to be able to save patterns
+# tools/mpy.py precompiles it for a quicker start, see there
 
-import board
 import time
-import random
 
-# led control
-import adafruit_dotstar
-from digitalio import DigitalInOut, Direction
+# when each part of starting up finished, set report_startup to see them
+startup_stages = [("start", time.monotonic_ns())]
+
 
-# button access
-import busio
-from adafruit_bus_device.i2c_device import I2CDevice
+def startup_stage(name):
+    startup_stages.append((name, time.monotonic_ns()))
 
-# midi comms
-import usb_midi
-import adafruit_midi
-from adafruit_midi.note_on import NoteOn
-from adafruit_midi.note_off import NoteOff
 
+import asyncio
+startup_stage("import asyncio")
+import gc
+import os
+import random
+from array import array
+startup_stage("import builtins")
 
-# led setup
-cs = DigitalInOut(board.GP17)
-cs.direction = Direction.OUTPUT
-cs.value = 0
-pixels = adafruit_dotstar.DotStar(board.GP18, board.GP19, 16,
-                                  brightness=0.5, auto_write=True)
+import backends
+startup_stage("import backends")
 
-# button setup
-i2c = busio.I2C(board.GP5, board.GP4)
-device = I2CDevice(i2c, 0x20)
 
-# midi setup
-midi = [adafruit_midi.MIDI(midi_out=usb_midi.ports[1], out_channel=ch) for ch in range(16)]
+# the keys, leds and midi ports all come from the board's backend
+# if the rgb keypad's interrupt pin is wired up set it here, backends.board.GP3
+# say, and the buttons are only read when there's news
+button_interrupt_pin = None
+backend = backends.detect(button_interrupt_pin)
+midi_in = backend.midi_in
+midi_out = backend.midi_out
+startup_stage("backend")
 
 
 # enums
@@ -45,13 +45,33 @@ class ButtonState:
     PRESSED = 1
     LONGPRESSED = 2
     RELEASED = 3
+    DOUBLE_TAPPED = 4
+    CHORD = 5
 
 
 class ButtonMode:
     PATTERN = 1
     NOTE_CHOOSER = 2
     CHANNEL_CHOOSER = 3
-    WAIT = 4
+    LENGTH_CHOOSER = 4
+    VIEW_CHOOSER = 5
+    TEMPO_CHOOSER = 6
+    SLOT_CHOOSER = 7
+    GATE_CHOOSER = 8
+    WAIT = 9
+
+
+class Lane:
+    NOTES = 1
+    VELOCITY = 2
+    ACCENT = 3
+    CHANCE = 4
+    NUDGE = 5
+
+
+class ClockSource:
+    INTERNAL = 1
+    EXTERNAL = 2
 
 
 class Color:
@@ -69,6 +89,20 @@ class Color:
     CHANNEL = (127, 127, 0)
     DRUM_CHANNEL = (0, 127, 0)
     
+    LENGTH = (127, 63, 0)
+    PAGE = (0, 63, 127)
+    LANE = (0, 31, 63)
+    VELOCITY = (255, 127, 0)
+    ACCENT = (255, 0, 0)
+    CHANCE = (0, 255, 127)
+    TEMPO = (127, 0, 63)
+    SLOT = (63, 127, 0)
+    LATE = (127, 0, 255)
+    EARLY = (0, 127, 255)
+    SWING = (63, 0, 127)
+    GATE = (0, 127, 63)
+    RECORD = (255, 0, 31)
+    
     MARKER = (16, 16, 16)
     NOTE = (255, 255, 255)
     NOTE_OFF = (7, 0, 0)
@@ -81,16 +115,436 @@ class Note:
     HOLD = 2
 
 
-def dim_color(color):
-    return tuple([int(0.1 * value) for value in color])
+class Pattern:
+    # every note's state for every channel and step, kept as bitmasks of the
+    # notes that are on or sounding at each step, a held note that isn't on
+    # is a hold. each channel loops over its own length, and the midi events
+    # for each channel and step are compiled ahead of time
+    def __init__(self, channels=16, notes=16, steps=64):
+        self.channels = channels
+        self.notes = notes
+        self.steps = steps
+        self.lengths = bytearray([16] * channels)
+        # how much of its last step each channel's notes last, as a percentage
+        self.gates = bytearray([100] * channels)
+        self.on_masks = array('H', [0] * (channels * steps))
+        self.held_masks = array('H', [0] * (channels * steps))
+        # each note's velocity as a level into velocity_levels, packed two to
+        # a byte, then accents and percentage chances for each whole step
+        # repeating a single byte rather than a list keeps the big ones from
+        # allocating four times their size on the way
+        self.velocities = bytearray(bytes([default_velocity_level * 17]) * (channels * notes * steps // 2))
+        self.accents = bytearray(channels * steps // 8)
+        self.chances = bytearray(bytes([100]) * (channels * steps))
+        # how far each step is played off the grid, in 96ths of a step
+        self.nudges = array('b', [0] * (channels * steps))
+        # None when a step has no events
+        self.events = [None] * (channels * steps)
+        # where it's saved and whether it's changed since
+        self.slot = 0
+        self.dirty = False
+    
+    def get(self, channel, note, step):
+        bit = 1 << note
+        mask = channel * self.steps + step
+        if self.on_masks[mask] & bit:
+            return Note.ON
+        if self.held_masks[mask] & bit:
+            return Note.HOLD
+        return Note.OFF
+    
+    def set(self, channel, note, step, value):
+        bit = 1 << note
+        mask = channel * self.steps + step
+        if value == Note.ON:
+            self.on_masks[mask] |= bit
+        else:
+            self.on_masks[mask] &= ~bit
+        if value == Note.OFF:
+            self.held_masks[mask] &= ~bit
+        else:
+            self.held_masks[mask] |= bit
+    
+    def row(self, channel, note):
+        return [self.get(channel, note, step) for step in range(self.steps)]
+    
+    def column(self, channel, step):
+        return [self.get(channel, note, step) for note in range(self.notes)]
+    
+    def on_mask(self, channel, step):
+        return self.on_masks[channel * self.steps + step]
+    
+    def held_mask(self, channel, step):
+        return self.held_masks[channel * self.steps + step]
+    
+    def velocity(self, channel, note, step):
+        # a step's notes sit next to each other so it only spans 8 bytes
+        index = (channel * self.steps + step) * self.notes + note
+        return self.velocities[index >> 1] >> ((index & 1) << 2) & 15
+    
+    def set_velocity(self, channel, note, step, level):
+        index = (channel * self.steps + step) * self.notes + note
+        shift = (index & 1) << 2
+        self.velocities[index >> 1] = self.velocities[index >> 1] & ~(15 << shift) | level << shift
+    
+    def accented(self, channel, step):
+        index = channel * self.steps + step
+        return self.accents[index >> 3] >> (index & 7) & 1
+    
+    def set_accent(self, channel, step, accent):
+        index = channel * self.steps + step
+        if accent:
+            self.accents[index >> 3] |= 1 << (index & 7)
+        else:
+            self.accents[index >> 3] &= ~(1 << (index & 7))
+    
+    def chance(self, channel, step):
+        return self.chances[channel * self.steps + step]
+    
+    def nudge(self, channel, step):
+        return self.nudges[channel * self.steps + step]
+    
+    def buffers(self):
+        # in the order they're saved, each new version adding to the end
+        return [self.lengths, self.on_masks, self.held_masks, self.accents,
+                self.chances, self.velocities, self.nudges, self.gates]
+    
+    def step_events(self, channel, step):
+        return self.events[channel * self.steps + step]
+    
+    def index_step(self, channel, step):
+        lastStep = (step - 1) % self.lengths[channel]
+        index = channel * self.steps + step
+        on = self.on_masks[index]
+        # notes that were sounding on the last step and are off on this one
+        off = self.held_masks[channel * self.steps + lastStep] & ~self.held_masks[index]
+        if not on and not off:
+            self.events[index] = None
+            return
+        
+        events = self.events[index]
+        if events is None:
+            events = self.events[index] = []
+        else:
+            del events[:]
+        # the note offs are grouped ahead of the note ons, which have their
+        # velocities encoded in now so playing them costs nothing extra
+        for _note in range(self.notes):
+            if off & (1 << _note):
+                events.append(note_off_messages[channel][_note])
+        boost = accent_boost if self.accented(channel, step) else 0
+        for _note in range(self.notes):
+            if on & (1 << _note):
+                velocity = velocity_levels[self.velocity(channel, _note, step)] + boost
+                events.append(encode_message(0x90 | channel, 36 + _note, min(velocity, 127)))
+    
+    def index_channel(self, channel):
+        # a saved note that's on is always held, whatever the file says
+        first = channel * self.steps
+        for i in range(first, first + self.steps):
+            self.held_masks[i] |= self.on_masks[i]
+        for step in range(self.steps):
+            if step < self.lengths[channel]:
+                self.index_step(channel, step)
+            else:
+                self.events[channel * self.steps + step] = None
+    
+    def index(self):
+        for channel in range(self.channels):
+            self.index_channel(channel)
+    
+    def clear(self, first=0):
+        # back to the defaults from the given buffer on, an older save only
+        # leaves the lanes it didn't have to clear
+        defaults = [16, 0, 0, 0, 100, default_velocity_level * 17, 0, 100]
+        buffers = self.buffers()
+        for i in range(first, len(buffers)):
+            fill(buffers[i], defaults[i])
+        self.events = [None] * len(self.events)
+
+
+def fill(buffer, value):
+    # copies of the first item are doubled up by slice assignment, a dozen or
+    # so copies in c rather than a loop over every item, and through a
+    # memoryview so nothing the size of the buffer is allocated
+    if not len(buffer):
+        return
+    buffer[0] = value
+    view = memoryview(buffer)
+    filled = 1
+    while filled < len(buffer):
+        count = min(filled, len(buffer) - filled)
+        view[filled:filled + count] = view[:count]
+        filled += count
+
+
+class Gestures:
+    # turns the raw key states into presses, releases, long presses, double
+    # taps and chords that each fire exactly once. a key has to read the same
+    # for the debounce time before it counts, times are in milliseconds and
+    # everything is kept in fixed size tables so scanning never allocates
+    def __init__(self, handler, keys=16, debounce=5, long_press=500, double_tap=300):
+        self.handler = handler
+        self.debounce = debounce
+        self.long_press = long_press
+        self.double_tap = double_tap
+        self.raw = 0
+        self.states = 0
+        # keys whose long press has gone out, keys whose last press was a
+        # short tap and keys pressed as the second half of a double tap
+        self.long_pressed = 0
+        self.tapped = 0
+        self.second_taps = 0
+        self.changed_times = array('l', [0] * keys)
+        self.pressed_times = array('l', [0] * keys)
+        self.released_times = array('l', [0] * keys)
+    
+    def update(self, raw, now, report=True):
+        changed = raw ^ self.raw
+        self.raw = raw
+        # only visit keys that are down or changing
+        active = raw | changed | self.states
+        i = 0
+        while active >> i:
+            bit = 1 << i
+            if changed & bit:
+                self.changed_times[i] = now
+            elif (raw ^ self.states) & bit:
+                if now - self.changed_times[i] >= self.debounce:
+                    if raw & bit:
+                        self.press(i, bit, now, report)
+                    else:
+                        self.release(i, bit, now, report)
+            elif self.states & ~self.long_pressed & bit:
+                if now - self.pressed_times[i] >= self.long_press:
+                    self.long_pressed |= bit
+                    if report:
+                        self.handler(i, ButtonState.LONGPRESSED)
+            i += 1
+    
+    def press(self, i, bit, now, report):
+        held = self.states
+        self.states |= bit
+        self.pressed_times[i] = now
+        double_tap = self.tapped & bit and now - self.released_times[i] <= self.double_tap
+        self.tapped &= ~bit
+        if double_tap:
+            self.second_taps |= bit
+        if not report:
+            return
+        self.handler(i, ButtonState.PRESSED)
+        if double_tap:
+            self.handler(i, ButtonState.DOUBLE_TAPPED)
+        if held:
+            # chords pass the mask of keys held rather than an index
+            self.handler(self.states, ButtonState.CHORD)
+    
+    def release(self, i, bit, now, report):
+        self.states &= ~bit
+        # neither a long press nor the end of a double tap starts another
+        if not (self.long_pressed | self.second_taps) & bit:
+            self.tapped |= bit
+            self.released_times[i] = now
+        self.long_pressed &= ~bit
+        self.second_taps &= ~bit
+        if report:
+            self.handler(i, ButtonState.RELEASED)
+
+
+def encode_message(status, data1, data2):
+    # messages are kept pre-encoded as a single small int so that storing
+    # and sending them never needs to allocate
+    return status << 16 | data1 << 8 | data2
+
+
+class MidiBuffer:
+    # collects all of a step's messages so they go out in a single write
+    # running status is optional as usb midi packets always carry the status
+    def __init__(self, port, size, running_status=False):
+        self.port = port
+        self.data = bytearray(size)
+        self.length = 0
+        self.status = 0
+        self.running_status = running_status
+    
+    def send(self, message):
+        if self.length + 3 > len(self.data):
+            self.flush()
+        status = message >> 16
+        if status != self.status or not self.running_status:
+            self.data[self.length] = status
+            self.length += 1
+            self.status = status
+        self.data[self.length] = message >> 8 & 0xFF
+        self.data[self.length + 1] = message & 0xFF
+        self.length += 2
+    
+    def flush(self):
+        if self.length:
+            # the length argument avoids slicing a new buffer for every write
+            self.port.write(self.data, self.length)
+            self.length = 0
+        self.status = 0
+
+
+class EventQueue:
+    # fixed size ring buffer of ints passed between tasks, the consumer
+    # sleeps on the event until something is put in
+    def __init__(self, size):
+        self.items = [0] * size
+        self.start = 0
+        self.count = 0
+        self.ready = asyncio.Event()
+    
+    def put(self, item):
+        if self.count == len(self.items):
+            # drop the oldest rather than hold up whoever is putting
+            self.start = (self.start + 1) % len(self.items)
+            self.count -= 1
+        self.items[(self.start + self.count) % len(self.items)] = item
+        self.count += 1
+        self.ready.set()
+    
+    async def get(self):
+        while not self.count:
+            self.ready.clear()
+            await self.ready.wait()
+        item = self.items[self.start]
+        self.start = (self.start + 1) % len(self.items)
+        self.count -= 1
+        return item
+
+
+class ActiveNotes:
+    # the notes sounding on each channel, note messages all go out through
+    # here so an off is only sent for a note that's on and whatever is left
+    # sounding can be turned off without a panic
+    def __init__(self, output, first_note=36):
+        self.output = output
+        self.first_note = first_note
+        self.masks = array('H', [0] * 16)
+    
+    def send(self, message):
+        _channel = message >> 16 & 15
+        bit = 1 << ((message >> 8 & 0x7F) - self.first_note)
+        if message & 0x100000 and message & 0x7F:
+            self.masks[_channel] |= bit
+        elif self.masks[_channel] & bit:
+            self.masks[_channel] &= ~bit
+        else:
+            return
+        self.output.send(message)
+    
+    def played(self, _channel, off, on):
+        # for a whole step's worth sent straight to the output
+        self.masks[_channel] = self.masks[_channel] & ~off | on
+    
+    def flush(self):
+        self.output.flush()
+    
+    def release(self):
+        for _channel in range(16):
+            mask = self.masks[_channel]
+            for _note in range(16):
+                if mask & (1 << _note):
+                    self.output.send(encode_message(0x80 | _channel, self.first_note + _note, 120))
+            self.masks[_channel] = 0
+        self.output.flush()
+
+
+class Schedule:
+    # fixed size queue of messages kept in the order they're due, counted in
+    # subdivisions of a step from the start time so they follow tempo changes
+    def __init__(self, output, size):
+        self.output = output
+        self.dues = array('l', [0] * size)
+        self.messages = array('l', [0] * size)
+        self.start = 0
+        self.count = 0
+    
+    def put(self, due, message):
+        size = len(self.dues)
+        if self.count == size:
+            # send the earliest early rather than lose a note off
+            self.output.send(self.pop())
+        # most arrive in order so the search back from the end is short, and
+        # equal dues keep their order so a step's offs stay ahead of its ons
+        i = self.count
+        while i:
+            before = (self.start + i - 1) % size
+            if self.dues[before] <= due:
+                break
+            self.dues[(before + 1) % size] = self.dues[before]
+            self.messages[(before + 1) % size] = self.messages[before]
+            i -= 1
+        self.dues[(self.start + i) % size] = due
+        self.messages[(self.start + i) % size] = message
+        self.count += 1
+    
+    def next_due(self):
+        return self.dues[self.start]
+    
+    def ons_before(self, due):
+        # whether any note ons are waiting to go out before the given due
+        size = len(self.dues)
+        for i in range(self.count):
+            index = (self.start + i) % size
+            if self.dues[index] >= due:
+                return False
+            if self.messages[index] & 0x100000:
+                return True
+        return False
+    
+    def pop(self):
+        message = self.messages[self.start]
+        self.start = (self.start + 1) % len(self.dues)
+        self.count -= 1
+        return message
+    
+    def clear(self):
+        self.count = 0
+
+
+def dim_color(color, amount=0.1):
+    return tuple([int(amount * value) for value in color])
+
+
+# velocity levels, the default being the 120 everything used to be sent at
+velocity_levels = [8, 16, 24, 32, 40, 48, 56, 64, 72, 80, 88, 96, 104, 112, 120, 127]
+default_velocity_level = 14
+accent_boost = 24
 
 
 # variables
 step = 0
 note = 0
 channel = 0
-pattern = [[[Note.OFF] * 16 for _ in range(16)] * 16 for _ in range(16)]
+page = 0
+lane = Lane.NOTES
+pattern = Pattern()
+# the step each channel last played
+channel_steps = bytearray(16)
+midi = MidiBuffer(midi_out, 16 * 16 * 3)
+active_notes = ActiveNotes(midi)
+# swung and nudged steps and notes with shorter gates wait here until due
+subdivisions = 96
+schedule = Schedule(active_notes, 512)
+# channels whose next step was nudged early enough to be sent already
+early_channels = 0
+note_off_messages = [[encode_message(0x80 | ch, 36 + n, 120) for n in range(16)] for ch in range(16)]
 button_map = [12, 13, 14, 15, 8, 9, 10, 11, 4, 5, 6, 7, 0, 1, 2, 3]
+# what pressing a step steps through in the velocity, chance and nudge lanes,
+# nudges staying within a quarter of a step so that even with the most swing
+# a channel's steps can't overtake each other
+velocity_choices = [14, 9, 5, 15]
+chance_choices = [100, 75, 50, 25]
+nudge_choices = [0, 12, 24, -12]
+# the percentage of each pair of steps the first one lasts
+swing_choices = [50, 58, 66, 75]
+swing = 50
+swing_delay = 0
+gate_choices = [(i + 1) * 100 // 16 for i in range(16)]
+tempo_choices = [60, 70, 80, 90, 100, 110, 120, 130, 140, 150, 160, 170, 180, 190, 200, 210]
 next_melody_note = [Note.ON, Note.HOLD, Note.OFF]
 next_drum_note = [Note.ON, Note.OFF]
 
@@ -104,62 +558,158 @@ melody_note_colors = [Color.MAJOR, Color.ACCIDENTAL, Color.SCALE, Color.ACCIDENT
                       Color.ACCIDENTAL, Color.SCALE, Color.ACCIDENTAL, Color.SCALE,
                       Color.MAJOR, Color.ACCIDENTAL, Color.SCALE, Color.ACCIDENTAL]
 melody_hold_note_colors = [dim_color(color) for color in melody_note_colors]
+velocity_colors = [dim_color(Color.VELOCITY, (level + 1) / 16) for level in range(16)]
+chance_colors = [dim_color(Color.CHANCE, amount) for amount in (0.1, 0.25, 0.5, 1)]
+late_dimmed_color = dim_color(Color.LATE, 0.25)
 dim_notes = [False] * 16
+led_frame = [Color.OFF] * 16
+changed_leds = 0
 
 button_mode = ButtonMode.PATTERN
-last_button_states = [0] * 16
-last_button_pressed_times = [None] * 16
+last_button_states = 0
+button_reads = 0
+
+# timing (all in nanoseconds so the timeline doesn't lose precision)
+# the step length changes with set_tempo() or follows the midi clock
+step_length = 105000000
+start_time = 0
+tick = 0
+report_timing = False
+report_startup = False
+lateness = 0
+max_lateness = 0
+total_lateness = 0
+dropped_steps = 0
+
+# midi clock, following it if something starts sending it
+follow_clock = True
+clock_source = ClockSource.INTERNAL
+clock_running = True
+clock_pulses = 0
+last_pulse_time = 0
+# pulses read in together after a stall all come in at the same time, so the
+# gap up to them is only measured once it's known how many there were
+last_pulse_count = 0
+previous_pulse_time = 0
+last_clock_time = 0
+pulse_interval = step_length // 6
+clock_timeout = 1000000000
+midi_in_buffer = bytearray(64)
+# the message coming in, which can carry on with the last one's status
+midi_in_status = 0
+midi_in_data = -1
+
+# recording notes from the midi input into the channel being edited
+recording = False
+# how long notes take to get here, taken off their times before they're
+# put on the nearest step
+record_offset = 0
+# the tick each note being held down started on
+record_ticks = array('l', [-1] * 16)
+
+# midi clock out, sent whenever the internal clock is running the steps
+send_clock = True
+clock_out_pulse = 6
+clock_message = bytes([0xF8])
+start_message = bytes([0xFA])
+continue_message = bytes([0xFB])
+stop_message = bytes([0xFC])
+
+# pattern storage, each slot is saved to its own file on the drive
+# which is only writable from here if boot.py has remounted it
+pattern_dir = "/patterns"
+# the header's last byte is the version, which says how many of the
+# pattern's buffers were saved, 1 being just the notes, 2 adding the
+# velocity, accent and chance lanes, 3 the nudges and 4 the gates
+pattern_header = b"SEQ3"
+pattern_version = 4
+version_buffers = [0, 3, 6, 7, 8]
+buffer_sizes = [len(pattern.lengths), 2 * len(pattern.on_masks), 2 * len(pattern.held_masks),
+                len(pattern.accents), len(pattern.chances), len(pattern.velocities), len(pattern.nudges),
+                len(pattern.gates)]
+sector_size = 4096
+next_pattern_slot = 0
+saved_slots = 0
+last_edit_time = 0
+save_delay = 2000000000
+can_save = True
+
+# song mode, playing through a list of slots and how many times to repeat
+# each, one pattern plays while the next is loaded and compiled into another
+song_path = pattern_dir + "/song.txt"
+song = []
+song_playing = False
+song_position = 0
+prepared_position = -1
+# only made once a song plays
+next_pattern = None
+pattern_start_tick = 0
+bank_end_tick = 0
+
+# memory
+gc_threshold = 32768
+gc_pauses = 0
+gc_collections = 0
+last_mem_free = gc.mem_free()
+
+# tasks
+step_queue = EventQueue(4)
+button_queue = EventQueue(32)
+leds_due = asyncio.Event()
+step_done = asyncio.Event()
+gap_tick = 0
+storage_due = asyncio.Event()
 
 
 def read_button_states():
-    pressed = [0] * 16
-    with device:
-        device.write(bytes([0x0]))
-        result = bytearray(2)
-        device.readinto(result)
-        b = result[0] | result[1] << 8
-        for i in range(16):
-            if not (1 << i) & b:
-                pressed[i] = 1
-            else:
-                pressed[i] = 0
-    return pressed
+    global button_reads
+    button_reads += 1
+    
+    # returns a bitmask of the pressed buttons
+    return backend.read_keys()
 
 
-def wait(delay):
-    update_leds()
+def collect_garbage():
+    global gc_pauses
+    global gc_collections
+    global last_mem_free
     
+    free = gc.mem_free()
+    if free > last_mem_free:
+        # free memory only goes back up when a collection we didn't ask for
+        # has run, which will have stalled whatever was happening at the time
+        gc_pauses += 1
+    if free < gc_threshold:
+        # collect now while the step's notes are out of the way
+        gc.collect()
+        gc_collections += 1
+        free = gc.mem_free()
+    last_mem_free = free
+
+
+def scan_buttons():
     global button_mode
     global last_button_states
-    global last_button_pressed_times
     
-    now = time.monotonic()
-    while time.monotonic() < now + delay:
-        button_states = read_button_states()
-        
-        if button_mode == ButtonMode.WAIT:
-            if all(state == 0 for state in button_states):
-                button_mode = ButtonMode.PATTERN
-        else:
-            for i in range(16):
-                if button_states[i] == 1 and last_button_states[i] == 0:
-                    last_button_pressed_times[i] = now
-                    button_press(i, ButtonState.PRESSED)
-                elif button_states[i] == 1:
-                    if last_button_pressed_times[i] + 0.5 < now:
-                        button_press(i, ButtonState.LONGPRESSED)
-                elif button_states[i] == 0 and last_button_states[i] == 1:
-                    button_press(i, ButtonState.RELEASED)
-                    last_button_pressed_times[i] = None
-        
-        last_button_states = button_states
-        time.sleep(0.001)
+    if backend.keys_changed():
+        last_button_states = read_button_states()
+    
+    # nothing is reported while waiting for every button to be let go
+    waiting = button_mode == ButtonMode.WAIT
+    gestures.update(last_button_states, time.monotonic_ns() // 1000000, not waiting)
+    if waiting and not gestures.states:
+        button_mode = ButtonMode.PATTERN
+
+
+def queue_button_event(index, state):
+    button_queue.put(index << 3 | state)
 
 
 def button_press(index, state):
     global note
     global channel
-    global pattern
+    global page
+    global lane
     global button_mode
     global dim_notes
     
@@ -172,98 +722,1119 @@ def button_press(index, state):
             note = 0
             channel = button_map[index]
             button_mode = ButtonMode.WAIT
+    elif button_mode == ButtonMode.LENGTH_CHOOSER:
+        if state == ButtonState.PRESSED:
+            # the pressed key becomes the channel's last step
+            set_length(channel, page * 16 + index + 1)
+            button_mode = ButtonMode.WAIT
+    elif button_mode == ButtonMode.VIEW_CHOOSER:
+        # pages along the top row, lanes on the next two and swing on the last
+        if state == ButtonState.PRESSED and index < 4:
+            page = index
+            button_mode = ButtonMode.WAIT
+        elif state == ButtonState.PRESSED and index < 9:
+            lane = index - 3
+            button_mode = ButtonMode.WAIT
+        elif state == ButtonState.PRESSED and index >= 12:
+            set_swing(swing_choices[index - 12])
+            button_mode = ButtonMode.WAIT
+    elif button_mode == ButtonMode.TEMPO_CHOOSER:
+        if state == ButtonState.PRESSED:
+            set_tempo(tempo_choices[button_map[index]])
+            button_mode = ButtonMode.WAIT
+    elif button_mode == ButtonMode.SLOT_CHOOSER:
+        if state == ButtonState.PRESSED:
+            choose_slot(button_map[index])
+            button_mode = ButtonMode.WAIT
+    elif button_mode == ButtonMode.GATE_CHOOSER:
+        if state == ButtonState.PRESSED:
+            set_gate(channel, gate_choices[button_map[index]])
+            button_mode = ButtonMode.WAIT
     elif button_mode == ButtonMode.PATTERN:
         if index == 15:
             if state == ButtonState.LONGPRESSED:
+                # the notes on anywhere in the channel's loop, a mask a step
+                # rather than every note of every step
+                on = 0
+                for _step in range(pattern.lengths[channel]):
+                    on |= pattern.on_mask(channel, _step)
                 for i in range(16):
-                    dim_notes[i] = any(n == Note.ON for n in pattern[channel][button_map[i]])
+                    dim_notes[i] = bool(on & (1 << button_map[i]))
                 button_mode = ButtonMode.NOTE_CHOOSER
             elif state == ButtonState.RELEASED:
-                toggle_note(index)
+                press_step(index)
         elif index == 12:
             if state == ButtonState.LONGPRESSED:
                 button_mode = ButtonMode.CHANNEL_CHOOSER
             elif state == ButtonState.RELEASED:
-                toggle_note(index)
+                press_step(index)
+        elif index == 0:
+            if state == ButtonState.LONGPRESSED:
+                button_mode = ButtonMode.LENGTH_CHOOSER
+            elif state == ButtonState.RELEASED:
+                press_step(index)
+        elif index == 1:
+            if state == ButtonState.LONGPRESSED:
+                button_mode = ButtonMode.VIEW_CHOOSER
+            elif state == ButtonState.RELEASED:
+                press_step(index)
+        elif index == 2:
+            if state == ButtonState.LONGPRESSED:
+                button_mode = ButtonMode.TEMPO_CHOOSER
+            elif state == ButtonState.RELEASED:
+                press_step(index)
+        elif index == 4:
+            if state == ButtonState.LONGPRESSED:
+                button_mode = ButtonMode.GATE_CHOOSER
+            elif state == ButtonState.RELEASED:
+                press_step(index)
+        elif index == 13:
+            if state == ButtonState.LONGPRESSED:
+                button_mode = ButtonMode.SLOT_CHOOSER
+            elif state == ButtonState.RELEASED:
+                press_step(index)
+        elif index == 5:
+            if state == ButtonState.LONGPRESSED:
+                toggle_recording()
+                button_mode = ButtonMode.WAIT
+            elif state == ButtonState.RELEASED:
+                press_step(index)
+        elif index == 14:
+            if state == ButtonState.LONGPRESSED:
+                toggle_song()
+                button_mode = ButtonMode.WAIT
+            elif state == ButtonState.RELEASED:
+                press_step(index)
         elif index == 3 and state == ButtonState.LONGPRESSED:
             reset()
         else:
             if state == ButtonState.PRESSED:
-                toggle_note(index)
+                press_step(index)
+
+
+def press_step(index):
+    if lane == Lane.NOTES:
+        toggle_note(index)
+    else:
+        edit_lane(index)
 
 
 def toggle_note(index):
-    global pattern
+    step = page * 16 + index
+    length = pattern.lengths[channel]
+    if step >= length:
+        return
+    
+    current = pattern.get(channel, note, step)
     if channel == 9:
-        pattern[channel][note][index] = next_drum_note[pattern[channel][note][index]]
+        pattern.set(channel, note, step, next_drum_note[current])
     else:
-        pattern[channel][note][index] = next_melody_note[pattern[channel][note][index]]
+        pattern.set(channel, note, step, next_melody_note[current])
+    
+    # a note's state affects the events on its own step and the step after
+    pattern.index_step(channel, step)
+    pattern.index_step(channel, (step + 1) % length)
+    pattern_changed()
 
 
-def update_notes(lastStep, step):
+def edit_lane(index):
+    step = page * 16 + index
+    if step >= pattern.lengths[channel]:
+        return
+    
+    if lane == Lane.VELOCITY:
+        if pattern.get(channel, note, step) != Note.ON:
+            return
+        level = pattern.velocity(channel, note, step)
+        if level in velocity_choices:
+            level = velocity_choices[(velocity_choices.index(level) + 1) % len(velocity_choices)]
+        else:
+            level = velocity_choices[0]
+        pattern.set_velocity(channel, note, step, level)
+    elif lane == Lane.ACCENT:
+        pattern.set_accent(channel, step, not pattern.accented(channel, step))
+    elif lane == Lane.CHANCE:
+        chance = pattern.chance(channel, step)
+        if chance in chance_choices:
+            chance = chance_choices[(chance_choices.index(chance) + 1) % len(chance_choices)]
+        else:
+            chance = chance_choices[0]
+        pattern.chances[channel * pattern.steps + step] = chance
+    elif lane == Lane.NUDGE:
+        nudge = pattern.nudge(channel, step)
+        if nudge in nudge_choices:
+            nudge = nudge_choices[(nudge_choices.index(nudge) + 1) % len(nudge_choices)]
+        else:
+            nudge = nudge_choices[0]
+        pattern.nudges[channel * pattern.steps + step] = nudge
+    
+    pattern.index_step(channel, step)
+    pattern_changed()
+
+
+def set_length(_channel, length):
+    old = pattern.lengths[_channel]
+    pattern.lengths[_channel] = length
+    # steps coming back into the loop may have been dropped or indexed after
+    # a different last step, and the first step now follows on from a
+    # different last step too
+    for _step in range(max(min(old, length) - 1, 0), max(old, length)):
+        if _step < length:
+            pattern.index_step(_channel, _step)
+        else:
+            pattern.events[_channel * pattern.steps + _step] = None
+    pattern.index_step(_channel, 0)
+    pattern_changed()
+
+
+def set_gate(_channel, gate):
+    pattern.gates[_channel] = gate
+    pattern_changed()
+
+
+def set_swing(percent):
+    global swing
+    global swing_delay
+    
+    swing = percent
+    # how far the second step of each pair is pushed back
+    swing_delay = (2 * percent - 100) * subdivisions // 100
+
+
+def update_notes(tick):
+    global early_channels
+    
+    if song_playing and tick >= bank_end_tick:
+        next_bank(tick)
+    
+    # the step's place in the schedule, swing pushing back every other one
+    due = (tick - 1) * subdivisions
+    swung = (tick - pattern_start_tick) & 1
+    # steps nudged early have to go in the schedule on the step before, but
+    # not if the next step comes from another pattern
+    look_ahead = not (song_playing and tick + 1 >= bank_end_tick)
+    early = early_channels
+    early_channels = 0
     for _channel in range(16):
-        for _note in range(16):
-            if pattern[_channel][_note][step] == Note.ON:
-                midi[_channel].send(NoteOn(36 + _note, 120))
-            elif pattern[_channel][_note][step] == Note.OFF:
-                if pattern[_channel][_note][lastStep] != Note.OFF:
-                    midi[_channel].send(NoteOff(36 + _note, 120))
+        length = pattern.lengths[_channel]
+        step = (tick - pattern_start_tick) % length
+        lastStep = channel_steps[_channel]
+        channel_steps[_channel] = step
+        if step != (lastStep + 1) % length:
+            # steps were skipped or the length changed under us so the
+            # indexed note offs may not cover everything
+            off = pattern.held_mask(_channel, lastStep) & ~pattern.held_mask(_channel, step)
+            for _note in range(16):
+                if off & (1 << _note):
+                    active_notes.send(note_off_messages[_channel][_note])
+        
+        index = _channel * pattern.steps
+        offset = pattern.nudges[index + step] + (swing_delay if swung else 0)
+        next_step = (step + 1) % length
+        next_offset = pattern.nudges[index + next_step] + (0 if swung else swing_delay)
+        if early & (1 << _channel):
+            start = due + offset
+        else:
+            start = due + offset if offset > 0 else due
+            if pattern.events[index + step]:
+                play_step(_channel, step, start if offset > 0 else 0)
+        if pattern.gates[_channel] < 100:
+            end_notes(_channel, step, next_step, start, due + subdivisions + next_offset)
+        if look_ahead and next_offset < 0:
+            if pattern.events[index + next_step]:
+                play_step(_channel, next_step, due + subdivisions + next_offset)
+            early_channels |= 1 << _channel
+    active_notes.flush()
+
+
+def play_step(_channel, step, due):
+    # sends the step's events straight away when due is 0, otherwise
+    # schedules them for later, only called for steps with events
+    events = pattern.step_events(_channel, step)
+    chance = pattern.chance(_channel, step)
+    # a step that loses its roll still turns its notes off, the
+    # random ints don't allocate like random.random() would
+    skip = chance < 100 and random.randrange(100) >= chance
+    if due:
+        for event in events:
+            if not (skip and event & 0x100000):
+                schedule.put(due, event)
+    elif pattern.gates[_channel] < 100:
+        # the gate may have turned some of the step's notes off already
+        for event in events:
+            if not (skip and event & 0x100000):
+                active_notes.send(event)
+    else:
+        # quicker to note what's sounding once for the whole step
+        for event in events:
+            if not (skip and event & 0x100000):
+                midi.send(event)
+        off = pattern.held_mask(_channel, (step - 1) % pattern.lengths[_channel]) & ~pattern.held_mask(_channel, step)
+        active_notes.played(_channel, off, 0 if skip else pattern.on_mask(_channel, step))
+
+
+def end_notes(_channel, step, next_step, start, next_start):
+    # notes that stop after this step, or start again on the next, are
+    # turned off once the gate's up but never after the next step starts
+    ending = pattern.held_mask(_channel, step) & (~pattern.held_mask(_channel, next_step) |
+                                                  pattern.on_mask(_channel, next_step))
+    if not ending:
+        return
+    end = min(start + pattern.gates[_channel] * subdivisions // 100, next_start)
+    for _note in range(16):
+        if ending & (1 << _note):
+            schedule.put(end, note_off_messages[_channel][_note])
+
+
+def due_time(due):
+    return start_time + due * step_length // subdivisions
+
+
+def send_scheduled():
+    now = time.monotonic_ns()
+    while schedule.count and due_time(schedule.next_due()) <= now:
+        active_notes.send(schedule.pop())
+    active_notes.flush()
+
+
+def step_gap_due():
+    # a flash write stalls for most of a step, so it waits for a step with
+    # nothing else due for most of it, only the next step's early notes. if
+    # a bar goes by without one it makes do with holding up some note offs
+    limit = tick * subdivisions + min(nudge_choices)
+    if schedule.count and schedule.next_due() < limit:
+        return tick - gap_tick >= 16 and not schedule.ons_before(limit)
+    return due_time(tick * subdivisions) - time.monotonic_ns() > step_length * 3 // 4
 
 
 def reset_notes():
+    global early_channels
+    
+    # nothing that's waiting should go out after, and only the notes that
+    # are actually sounding need turning off
+    schedule.clear()
+    early_channels = 0
+    active_notes.release()
+
+
+def all_notes_off():
+    # for when what's sounding isn't known
     for _channel in range(16):
         for _note in range(16):
-            midi[_channel].send(NoteOff(36 + _note, 120))
+            midi.send(note_off_messages[_channel][_note])
+    midi.flush()
 
 
 def reset():
     global note
     global channel
-    global pattern
+    global page
     
     note = 0
     channel = 9
-    pattern = [[[Note.OFF] * 16 for _ in range(16)] * 16 for _ in range(16)]
+    page = 0
+    pattern.clear()
+    pattern_changed()
     
     reset_notes()
 
 
+def pattern_changed():
+    global last_edit_time
+    
+    pattern.dirty = True
+    last_edit_time = time.monotonic_ns()
+    storage_due.set()
+
+
+def choose_slot(slot):
+    global next_pattern_slot
+    global song_playing
+    
+    # picking a pattern by hand takes over from the song
+    song_playing = False
+    next_pattern_slot = slot
+    storage_due.set()
+
+
+def slot_path(slot, extension="bin"):
+    return "{}/{}.{}".format(pattern_dir, slot, extension)
+
+
+def find_saved_slots():
+    global saved_slots
+    
+    try:
+        os.mkdir(pattern_dir)
+    except OSError:
+        pass
+    try:
+        names = os.listdir(pattern_dir)
+    except OSError:
+        return
+    for name in names:
+        slot, _, extension = name.partition(".")
+        if slot.isdigit() and extension in ("bin", "new"):
+            saved_slots |= 1 << int(slot)
+
+
+def read_pattern(slot, into):
+    # a save is written to a new file and renamed over the old one, so if
+    # power went at the wrong moment the new file is all there is
+    for path in (slot_path(slot), slot_path(slot, "new")):
+        try:
+            size = os.stat(path)[6]
+            file = open(path, "rb")
+        except OSError:
+            continue
+        try:
+            header = file.read(len(pattern_header) + 1)
+            if len(header) <= len(pattern_header) or header[:-1] != pattern_header:
+                continue
+            version = header[-1]
+            if not 0 < version <= pattern_version:
+                continue
+            count = version_buffers[version]
+            if size != len(header) + sum(buffer_sizes[:count]):
+                continue
+            # straight into the pattern's buffers so nothing big is allocated
+            buffers = into.buffers()
+            for i in range(count):
+                file.readinto(buffers[i])
+            if count < len(buffers):
+                into.clear(count)
+        finally:
+            file.close()
+        
+        # indexing it makes sure its notes that are on are held too
+        for i in range(into.channels):
+            into.lengths[i] = min(max(into.lengths[i], 1), into.steps)
+            into.gates[i] = min(max(into.gates[i], 1), 100)
+        into.slot = slot
+        into.dirty = False
+        return True
+    return False
+
+
+def load_pattern(slot, into):
+    if not read_pattern(slot, into):
+        return False
+    into.index()
+    return True
+
+
+def read_song():
+    global song
+    
+    # one pattern per line, the slot then optionally how many times to play it
+    #   0 4
+    #   1
+    #   2 2  # the chorus
+    song = []
+    try:
+        file = open(song_path)
+    except OSError:
+        return
+    with file:
+        for line in file:
+            fields = line.split("#")[0].split()
+            try:
+                if fields:
+                    song.append((int(fields[0]) & 15, int(fields[1]) if len(fields) > 1 else 1))
+            except ValueError:
+                print("skipping song line:", line)
+
+
+def toggle_song():
+    global song_playing
+    global song_position
+    global prepared_position
+    global bank_end_tick
+    
+    if song_playing:
+        # carry on looping whichever pattern is playing
+        song_playing = False
+        return
+    
+    read_song()
+    if not song:
+        print("no song in", song_path)
+        return
+    song_playing = True
+    song_position = -1
+    prepared_position = -1
+    # the song comes in at the end of the current bar
+    bar = max(pattern.lengths)
+    bank_end_tick = tick + bar - (tick - pattern_start_tick) % bar
+    storage_due.set()
+
+
+def next_bank(tick):
+    global pattern
+    global next_pattern
+    global song_position
+    global pattern_start_tick
+    global bank_end_tick
+    global next_pattern_slot
+    
+    position = (song_position + 1) % len(song)
+    if prepared_position != position:
+        # it wasn't ready in time so go round the current one again
+        bank_end_tick = tick + max(pattern.lengths)
+        return
+    
+    # the new pattern's first step can only turn off what it knows about,
+    # so stop anything left sounding from the old one
+    for _channel in range(16):
+        off = pattern.held_mask(_channel, channel_steps[_channel]) & ~next_pattern.held_mask(_channel, 0)
+        for _note in range(16):
+            if off & (1 << _note):
+                active_notes.send(note_off_messages[_channel][_note])
+        channel_steps[_channel] = next_pattern.lengths[_channel] - 1
+    
+    pattern, next_pattern = next_pattern, pattern
+    next_pattern_slot = pattern.slot
+    song_position = position
+    pattern_start_tick = tick
+    bank_end_tick = tick + max(pattern.lengths) * song[position][1]
+    # start on the one after
+    storage_due.set()
+
+
+async def prepare_next_pattern(slot):
+    # loads a slot into next_pattern while the other plays, returning False
+    # if there's nothing saved in it
+    global next_pattern
+    
+    if next_pattern is None:
+        next_pattern = Pattern()
+    if next_pattern.dirty and can_save:
+        # edits to the last pattern need saving before its buffers are reused
+        await save_pattern(next_pattern)
+    await step_gap()
+    if not read_pattern(slot, next_pattern):
+        return False
+    # a channel at a time so the steps carry on meanwhile
+    for _channel in range(16):
+        next_pattern.index_channel(_channel)
+        await asyncio.sleep(0)
+    return True
+
+
+async def prepare_song_bank():
+    global prepared_position
+    
+    position = (song_position + 1) % len(song)
+    slot = song[position][0]
+    if not await prepare_next_pattern(slot):
+        next_pattern.clear()
+        next_pattern.slot = slot
+        next_pattern.dirty = False
+    prepared_position = position
+
+
+def song_bank_due():
+    return song_playing and prepared_position != (song_position + 1) % len(song)
+
+
+async def step_gap():
+    # writing to flash stalls the whole chip, so each write waits to start
+    # right after a step's notes have gone out when there's most time spare
+    if clock_source == ClockSource.EXTERNAL and not clock_running:
+        return
+    step_done.clear()
+    await step_done.wait()
+
+
+async def save_pattern(_pattern):
+    global saved_slots
+    global can_save
+    
+    # anything changed from here on needs saving again
+    _pattern.dirty = False
+    slot = _pattern.slot
+    path = slot_path(slot)
+    new_path = slot_path(slot, "new")
+    try:
+        await step_gap()
+        file = open(new_path, "wb")
+        try:
+            file.write(pattern_header)
+            file.write(bytes([pattern_version]))
+            # a sector or so at a time to keep each stall short
+            unflushed = 0
+            for buffer, size in zip(_pattern.buffers(), buffer_sizes):
+                # memoryviews slice by item rather than byte
+                items = len(buffer) * sector_size // size or 1
+                view = memoryview(buffer)
+                for start in range(0, len(buffer), items):
+                    part = view[start:start + items]
+                    part_size = len(part) * size // len(buffer)
+                    if unflushed and unflushed + part_size > sector_size:
+                        file.flush()
+                        unflushed = 0
+                        await step_gap()
+                    file.write(part)
+                    unflushed += part_size
+            file.flush()
+            await step_gap()
+        finally:
+            file.close()
+        await step_gap()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        os.rename(new_path, path)
+    except OSError as error:
+        # most likely the drive is still read only without boot.py
+        print("couldn't save the pattern:", error)
+        can_save = False
+        return
+    saved_slots |= 1 << slot
+
+
 def update_leds():
-    if button_mode == ButtonMode.PATTERN:
+    if button_mode == ButtonMode.PATTERN and lane != Lane.NOTES:
+        length = pattern.lengths[channel]
         for i in range(16):
-            noteType = pattern[channel][note][i]
-            if i == step:
-                pixels[i] = Color.NOTE if noteType == Note.ON else Color.MARKER
+            _step = page * 16 + i
+            if _step >= length:
+                set_led(i, Color.OFF)
+            elif _step == step:
+                set_led(i, Color.NOTE)
+            elif lane == Lane.VELOCITY:
+                if pattern.get(channel, note, _step) == Note.ON:
+                    set_led(i, velocity_colors[pattern.velocity(channel, note, _step)])
+                else:
+                    set_led(i, Color.NOTE_OFF)
+            elif lane == Lane.ACCENT:
+                set_led(i, Color.ACCENT if pattern.accented(channel, _step) else Color.NOTE_OFF)
+            elif lane == Lane.CHANCE:
+                set_led(i, chance_colors[max(pattern.chance(channel, _step) - 1, 0) // 25])
+            else:
+                nudge = pattern.nudge(channel, _step)
+                if nudge < 0:
+                    set_led(i, Color.EARLY)
+                elif nudge == 0:
+                    set_led(i, Color.NOTE_OFF)
+                else:
+                    set_led(i, late_dimmed_color if nudge <= 12 else Color.LATE)
+    elif button_mode == ButtonMode.PATTERN:
+        length = pattern.lengths[channel]
+        for i in range(16):
+            _step = page * 16 + i
+            if _step >= length:
+                set_led(i, Color.OFF)
+                continue
+            noteType = pattern.get(channel, note, _step)
+            if _step == step:
+                if noteType == Note.ON:
+                    set_led(i, Color.NOTE)
+                else:
+                    set_led(i, Color.RECORD if recording else Color.MARKER)
             elif channel == 9:
-                pixels[i] = drum_note_colors[note] if noteType == Note.ON else Color.OFF
+                set_led(i, drum_note_colors[note] if noteType == Note.ON else Color.OFF)
             else:
                 if noteType == Note.ON:
-                    pixels[i] = melody_note_colors[note]
+                    set_led(i, melody_note_colors[note])
                 elif noteType == Note.HOLD:
-                    pixels[i] = melody_hold_note_colors[note]
+                    set_led(i, melody_hold_note_colors[note])
                 else:
-                    pixels[i] = Color.NOTE_OFF
+                    set_led(i, Color.NOTE_OFF)
     elif button_mode == ButtonMode.NOTE_CHOOSER:
         for i in range(16):
             if channel == 9:
                 if dim_notes[i]:
-                    pixels[i] = drum_note_colors[button_map[i]]
+                    set_led(i, drum_note_colors[button_map[i]])
                 else:
-                    pixels[i] = note_dimmed_colors[button_map[i]]
+                    set_led(i, note_dimmed_colors[button_map[i]])
             else:
-                pixels[i] = melody_note_colors[button_map[i]]
+                set_led(i, melody_note_colors[button_map[i]])
     elif button_mode == ButtonMode.CHANNEL_CHOOSER:
         for i in range(16):
-            pixels[i] = Color.DRUM_CHANNEL if button_map[i] == 9 else Color.CHANNEL
+            set_led(i, Color.DRUM_CHANNEL if button_map[i] == 9 else Color.CHANNEL)
+    elif button_mode == ButtonMode.LENGTH_CHOOSER:
+        length = pattern.lengths[channel]
+        for i in range(16):
+            set_led(i, Color.LENGTH if page * 16 + i < length else Color.NOTE_OFF)
+    elif button_mode == ButtonMode.VIEW_CHOOSER:
+        pages = (pattern.lengths[channel] + 15) // 16
+        for i in range(16):
+            if i == page or i == lane + 3 or i >= 12 and swing_choices[i - 12] == swing:
+                set_led(i, Color.NOTE)
+            elif i < pages:
+                set_led(i, Color.PAGE)
+            elif i < 4:
+                set_led(i, Color.NOTE_OFF)
+            elif i < 9:
+                set_led(i, Color.LANE)
+            elif i >= 12:
+                set_led(i, Color.SWING)
+            else:
+                set_led(i, Color.OFF)
+    elif button_mode == ButtonMode.SLOT_CHOOSER:
+        for i in range(16):
+            slot = button_map[i]
+            if slot == pattern.slot:
+                set_led(i, Color.NOTE)
+            elif saved_slots & (1 << slot):
+                set_led(i, Color.SLOT)
+            else:
+                set_led(i, Color.NOTE_OFF)
+    elif button_mode == ButtonMode.GATE_CHOOSER:
+        gate = pattern.gates[channel]
+        for i in range(16):
+            set_led(i, Color.GATE if gate_choices[button_map[i]] <= gate else Color.NOTE_OFF)
+    elif button_mode == ButtonMode.TEMPO_CHOOSER:
+        # lit up to the current tempo like a meter
+        bpm = 15000000000 // step_length
+        for i in range(16):
+            set_led(i, Color.TEMPO if tempo_choices[button_map[i]] <= bpm else Color.NOTE_OFF)
     # don't update if waiting
+    
+    show_leds()
+
+
+def set_led(index, color):
+    global changed_leds
+    if led_frame[index] != color:
+        led_frame[index] = color
+        changed_leds |= 1 << index
+
+
+def show_leds():
+    global changed_leds
+    # only push a frame out when at least one pixel is different
+    if changed_leds:
+        backend.write_frame(led_frame, changed_leds)
+        changed_leds = 0
+
+
+def next_tick():
+    global tick
+    global lateness
+    global max_lateness
+    global total_lateness
+    global dropped_steps
+    
+    # each tick is scheduled from the start time rather than the end of the last
+    # step so the time spent sending notes and scanning buttons doesn't add up
+    lateness = time.monotonic_ns() - (start_time + tick * step_length)
+    if lateness >= step_length:
+        # skip any steps we've completely missed instead of playing catch up
+        missed = lateness // step_length
+        dropped_steps += missed
+        tick += missed
+        lateness -= missed * step_length
+    
+    total_lateness += lateness
+    if lateness > max_lateness:
+        max_lateness = lateness
+    tick += 1
+
+
+def receive_midi():
+    global midi_in_status
+    global midi_in_data
+    
+    # parsed a byte at a time straight out of the buffer without building
+    # any message objects, keeping what's been seen of the message so far
+    count = midi_in.readinto(midi_in_buffer)
+    if not count:
+        return
+    now = time.monotonic_ns()
+    for i in range(count):
+        byte = midi_in_buffer[i]
+        if byte >= 0xF8:
+            # realtime messages are single bytes that can turn up anywhere,
+            # even in the middle of another message
+            if byte == 0xF8:
+                clock_pulse(now)
+            elif byte == 0xFA:
+                clock_start(now, True)
+            elif byte == 0xFB:
+                clock_start(now, False)
+            elif byte == 0xFC:
+                clock_stop(now)
+        elif byte & 0x80:
+            # system common messages and sysex end running status
+            midi_in_status = byte if byte < 0xF0 else 0
+            midi_in_data = -1
+        elif midi_in_status and midi_in_status & 0xE0 != 0xC0:
+            # everything but program change and channel pressure has two
+            # data bytes, and the status stays for the next message
+            if midi_in_data < 0:
+                midi_in_data = byte
+            else:
+                if midi_in_status < 0xA0:
+                    record_note(midi_in_status, midi_in_data, byte, now)
+                midi_in_data = -1
+
+
+def velocity_level(velocity):
+    # the nearest of velocity_levels, all but the last are 8 apart
+    return min(max((velocity + 4) // 8 - 1, 0), 15)
+
+
+def toggle_recording():
+    global recording
+    
+    recording = not recording
+    for i in range(16):
+        record_ticks[i] = -1
+
+
+def record_note(status, data1, data2, now):
+    # puts a note on the nearest step, filling in the steps it's held over
+    # once it's let go, on whichever channel is being edited
+    _note = data1 - 36
+    if not recording or not clock_running or not 0 <= _note < 16:
+        return
+    # each tick is due a step length after the start time for the last one
+    _tick = (now - record_offset - start_time + step_length // 2) // step_length + 1
+    length = pattern.lengths[channel]
+    if status & 0xF0 == 0x90 and data2:
+        record_ticks[_note] = _tick
+        _step = (_tick - pattern_start_tick) % length
+        pattern.set(channel, _note, _step, Note.ON)
+        pattern.set_velocity(channel, _note, _step, velocity_level(data2))
+        pattern.index_step(channel, _step)
+        pattern.index_step(channel, (_step + 1) % length)
+    else:
+        start = record_ticks[_note]
+        record_ticks[_note] = -1
+        if start < 0 or channel == 9:
+            # drums are only ever on for a step
+            return
+        for held_tick in range(start + 1, min(_tick, start + length)):
+            _step = (held_tick - pattern_start_tick) % length
+            if pattern.get(channel, _note, _step) == Note.OFF:
+                pattern.set(channel, _note, _step, Note.HOLD)
+                pattern.index_step(channel, _step)
+                pattern.index_step(channel, (_step + 1) % length)
+    pattern_changed()
+    leds_due.set()
+
+
+def follow_external_clock(now):
+    global clock_source
+    global clock_pulses
+    global last_pulse_time
+    global previous_pulse_time
+    global last_clock_time
+    
+    last_clock_time = now
+    if clock_source == ClockSource.INTERNAL:
+        if send_clock:
+            # let anything following us know we've stopped driving it
+            midi_out.write(stop_message)
+        clock_source = ClockSource.EXTERNAL
+        clock_pulses = 0
+        last_pulse_time = 0
+        previous_pulse_time = 0
+
+
+def clock_pulse(now):
+    global tick
+    global start_time
+    global step_length
+    global clock_pulses
+    global last_pulse_time
+    global last_pulse_count
+    global previous_pulse_time
+    global pulse_interval
+    
+    if not follow_clock:
+        return
+    follow_external_clock(now)
+    
+    if now > last_pulse_time:
+        if previous_pulse_time:
+            # smooth out the usb and polling jitter in the pulse times, the
+            # gap up to the last ones shared out between however many came in
+            interval = (last_pulse_time - previous_pulse_time) // last_pulse_count
+            pulse_interval += (interval - pulse_interval) // 8
+            # keep the step that's playing where it is as set_tempo does, or
+            # everything timed from the start time jumps between step pulses
+            start_time += (tick - 1) * (step_length - pulse_interval * 6)
+            step_length = pulse_interval * 6
+        previous_pulse_time = last_pulse_time
+        last_pulse_time = now
+        last_pulse_count = 1
+    else:
+        last_pulse_count += 1
+    
+    if not clock_running:
+        return
+    if clock_pulses == 0:
+        # 24 pulses per quarter note makes 6 per 16th note step, and moving
+        # the start time keeps next_deadline() predicting the next step
+        tick += 1
+        start_time = now + step_length - tick * step_length
+        advance_step()
+    clock_pulses = (clock_pulses + 1) % 6
+
+
+def clock_start(now, from_beginning):
+    global tick
+    global clock_running
+    global clock_pulses
+    global pattern_start_tick
+    global bank_end_tick
+    global song_position
+    global prepared_position
+    
+    if not follow_clock:
+        return
+    follow_external_clock(now)
+    
+    clock_running = True
+    if from_beginning:
+        # the next pulse is the first beat, and anything still waiting was
+        # due on the old ticks
+        tick = -1
+        clock_pulses = 0
+        reset_notes()
+        pattern_start_tick = 0
+        if song_playing:
+            # back to the top of the song on the first beat, or a bar later
+            # if its first pattern can't be read in time
+            song_position = -1
+            prepared_position = -1
+            bank_end_tick = 0
+            storage_due.set()
+
+
+def clock_stop(now):
+    global clock_running
+    
+    if not follow_clock:
+        return
+    follow_external_clock(now)
+    
+    clock_running = False
+    reset_notes()
+    # no more steps are coming to wait on
+    step_done.set()
+
+
+def check_clock_timeout():
+    global clock_source
+    global start_time
+    
+    # if the clock goes away mid song carry on at the tempo it was going
+    if clock_source == ClockSource.EXTERNAL and clock_running:
+        now = time.monotonic_ns()
+        if now - last_clock_time > clock_timeout:
+            clock_source = ClockSource.INTERNAL
+            start_time = now - tick * step_length
+            if send_clock:
+                midi_out.write(continue_message)
+
+
+def set_tempo(bpm):
+    global start_time
+    global step_length
+    
+    # keep the step that's playing where it is and stretch the rest of the
+    # timeline out from there, 4 steps to the beat
+    length = 15000000000 // bpm
+    start_time += (tick - 1) * (step_length - length)
+    step_length = length
+
+
+def advance_step():
+    global step
+    # the step shown is the current channel's, the midi task works out the rest
+    step = (tick - pattern_start_tick) % pattern.lengths[channel]
+    step_queue.put(tick)
+
 
+def next_deadline():
+    # the next of the step's clock pulses, or the next step once they're sent,
+    # both worked out from the start time so clock and notes can't drift apart
+    return start_time + ((tick - 1) * 6 + clock_out_pulse) * step_length // 6
 
+
+def clock_due(margin=1000000):
+    # lets the other tasks get out of the way of the clock and anything
+    # that's scheduled
+    now = time.monotonic_ns() + margin
+    if schedule.count and now >= due_time(schedule.next_due()):
+        return True
+    return now >= next_deadline()
+
+
+def print_timing():
+    print("tick: {}, late: {}us, max: {}us, mean: {}us, dropped: {}, gc pauses: {}, collections: {}, button reads: {}".format(
+        tick, lateness // 1000, max_lateness // 1000,
+        total_lateness // max(tick, 1) // 1000, dropped_steps, gc_pauses, gc_collections, button_reads))
+
+
+def print_startup():
+    # each stage from the end of the last, the time before the first line
+    # ran is spent compiling unless it's been precompiled
+    last = startup_stages[0][1]
+    for name, at in startup_stages[1:]:
+        print("{}: {:.1f}ms".format(name, (at - last) / 1000000))
+        last = at
+    print("first step after {:.1f}ms".format((last - startup_stages[0][1]) / 1000000))
+
+
+async def clock_task():
+    global start_time
+    global clock_out_pulse
+    
+    start_time = time.monotonic_ns()
+    startup_stage("first step")
+    if report_startup:
+        print_startup()
+    if send_clock:
+        midi_out.write(start_message)
+    while True:
+        if clock_source == ClockSource.EXTERNAL:
+            # the steps are coming from the midi clock instead
+            clock_out_pulse = 6
+            await asyncio.sleep(0.01)
+            continue
+        
+        next_tick()
+        if send_clock:
+            # the step's first pulse goes out ahead of its notes
+            midi_out.write(clock_message)
+        advance_step()
+        if report_timing and tick % 16 == 0:
+            print_timing()
+        
+        # sleep for most of the way to each deadline then keep yielding until
+        # it, asyncio only sleeps to the millisecond so this keeps the clock tight
+        clock_out_pulse = 1 if send_clock else 6
+        while clock_source == ClockSource.INTERNAL:
+            remaining = next_deadline() - time.monotonic_ns()
+            if remaining > 2000000:
+                await asyncio.sleep((remaining - 1000000) / 1000000000)
+            elif remaining > 0:
+                await asyncio.sleep(0)
+            elif clock_out_pulse < 6:
+                # 24 pulses per quarter note makes 6 per 16th note step
+                midi_out.write(clock_message)
+                clock_out_pulse += 1
+            else:
+                break
+
+
+async def midi_task():
+    global gap_tick
+    
+    while True:
+        if schedule.count and not step_queue.count and schedule.next_due() < tick * subdivisions:
+            # something's scheduled before the next step, waited for in the
+            # same way as the clock so the buttons are still read meanwhile
+            remaining = due_time(schedule.next_due()) - time.monotonic_ns()
+            if remaining > 2000000:
+                await asyncio.sleep((remaining - 1000000) / 1000000000)
+            elif remaining > 0:
+                await asyncio.sleep(0)
+            else:
+                send_scheduled()
+                if step_gap_due():
+                    gap_tick = tick
+                    step_done.set()
+            continue
+        update_notes(await step_queue.get())
+        if step_gap_due():
+            gap_tick = tick
+            step_done.set()
+        leds_due.set()
+        collect_garbage()
+
+
+async def midi_in_task():
+    while True:
+        receive_midi()
+        check_clock_timeout()
+        await asyncio.sleep(0.001)
+
+
+async def button_task():
+    while True:
+        if not clock_due():
+            scan_buttons()
+        await asyncio.sleep(0.001)
+
+
+async def ui_task():
+    while True:
+        event = await button_queue.get()
+        button_press(event >> 3, event & 7)
+        leds_due.set()
+
+
+async def led_task():
+    while True:
+        await leds_due.wait()
+        leds_due.clear()
+        while clock_due():
+            await asyncio.sleep(0)
+        update_leds()
+
+
+async def storage_task():
+    global pattern
+    global next_pattern
+    global prepared_position
+    
+    # the saved slots are only needed to choose one, so the drive isn't
+    # looked over until the steps are going
+    await step_gap()
+    find_saved_slots()
+    while True:
+        await storage_due.wait()
+        storage_due.clear()
+        if song_bank_due():
+            # the next pattern in the song is needed by the end of this one
+            await prepare_song_bank()
+        
+        # hold off until the edits have settled, unless there's something
+        # more pressing to do
+        while (next_pattern_slot == pattern.slot and not song_bank_due() and
+               time.monotonic_ns() - last_edit_time < save_delay):
+            await asyncio.sleep(0.25)
+        if song_bank_due():
+            storage_due.set()
+            continue
+        if pattern.dirty and can_save:
+            await save_pattern(pattern)
+        
+        if next_pattern_slot != pattern.slot:
+            if await prepare_next_pattern(next_pattern_slot):
+                pattern, next_pattern = next_pattern, pattern
+                # whatever was ready for the song isn't any more
+                prepared_position = -1
+                reset_notes()
+            else:
+                # an empty slot starts out as a copy of the last one
+                pattern.slot = next_pattern_slot
+                pattern_changed()
+            leds_due.set()
+
+
+async def main():
+    await asyncio.gather(clock_task(), midi_task(), midi_in_task(), button_task(), ui_task(), led_task(), storage_task())
+
+
+startup_stage("setup")
 # midi panic for script reloading
-reset_notes()
-
-# main loop
-while True:
-    lastStep = step
-    step = (step + 1) % 16
-    update_notes(lastStep, step)
-    wait(0.105)
+all_notes_off()
+startup_stage("midi panic")
+
+gestures = Gestures(queue_button_event)
+
+load_pattern(0, pattern)
+startup_stage("load pattern")
+# clear away what setting up left behind now rather than in the first bars
+gc.collect()
+startup_stage("gc")
+
+asyncio.run(main())
@@ -0,0 +1,16 @@
+# host side simulation of the pico sequencers
+# fakes board, digitalio, busio, adafruit_bus_device, adafruit_dotstar,
+# usb_midi, keybow2040, gc, os, time and the drive so the scripts run
+# unmodified on linux, with asyncio running its event loop on the same
+# virtual clock:
+#
+#   python -m sim seq3.py --seconds 4 --press 15@0.5+0.8 --press 4@1.6
+#
+# or from python:
+#
+#   simulator = Simulator(duration=4)
+#   simulator.press(15, at=0.5, hold=0.8)
+#   namespace = simulator.run("seq3.py")
+
+from .clock import StopSimulation, VirtualClock
+from .simulator import Simulator
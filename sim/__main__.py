@@ -0,0 +1,72 @@
+# command line runner, prints what the script sent out over midi and the leds
+#
+#   python -m sim seq3.py --seconds 4 --press 15@0.5+0.8 --press 4@1.6 --midi
+
+import argparse
+
+from .simulator import Simulator
+
+
+def parse_press(text):
+    # KEY@START[+HOLD], times in seconds
+    key, _, timing = text.partition("@")
+    start, _, hold = timing.partition("+")
+    return int(key), float(start or 0), float(hold or 0.05)
+
+
+def parse_clock(text):
+    # BPM@START[-STOP]
+    bpm, _, timing = text.partition("@")
+    start, _, stop = timing.partition("-")
+    return float(bpm), float(start or 0), float(stop) if stop else None
+
+
+def parse_send(text):
+    # HEX@START, the bytes as hex
+    data, _, start = text.partition("@")
+    return bytes.fromhex(data), float(start or 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m sim", description="run a sequencer script against simulated hardware")
+    parser.add_argument("script")
+    parser.add_argument("--board", choices=["pico", "keybow", "host"], default="pico", help="which backend the script finds itself on")
+    parser.add_argument("--seconds", type=float, default=4.0, help="virtual time to run for")
+    parser.add_argument("--press", action="append", default=[], type=parse_press, metavar="KEY@START[+HOLD]")
+    parser.add_argument("--clock", type=parse_clock, metavar="BPM@START[-STOP]", help="send midi clock into the script")
+    parser.add_argument("--send", action="append", default=[], type=parse_send, metavar="HEX@START", help="send raw midi into the script")
+    parser.add_argument("--storage", metavar="DIR", help="directory to keep the drive in between runs")
+    parser.add_argument("--readonly", action="store_true", help="leave the drive read only as it is without boot.py")
+    parser.add_argument("--midi", action="store_true", help="print every midi message sent")
+    parser.add_argument("--frames", action="store_true", help="print every led frame pushed")
+    args = parser.parse_args()
+    
+    simulator = Simulator(duration=args.seconds, storage=args.storage, readonly=args.readonly, board=args.board)
+    for key, start, hold in args.press:
+        simulator.press(key, start, hold)
+    if args.clock:
+        simulator.send_clock(*args.clock)
+    for data, start in args.send:
+        simulator.send_midi(data, start)
+    simulator.run(args.script)
+    
+    messages = simulator.midi_messages()
+    if args.midi:
+        for time, status, data1, data2 in messages:
+            print("{:10.6f}  {:02x} {} {}".format(time / 1000000000, status,
+                  "" if data1 is None else data1, "" if data2 is None else data2))
+    if args.frames:
+        for time, frame in simulator.leds.frames:
+            print("{:10.6f}  {}".format(time / 1000000000, frame))
+    
+    print("virtual time: {:.3f}s".format(simulator.clock.now / 1000000000))
+    print("midi: {} messages, {} bytes in {} writes".format(
+        len(messages), len(simulator.midi_out.data), len(simulator.midi_out.writes)))
+    print("leds: {} frames, {} pixel writes".format(len(simulator.leds.frames), simulator.leds.writes))
+    print("buttons: {} reads".format(simulator.button_reads))
+    print("gc: {} collections".format(simulator.gc_collections))
+    print("storage: {} sector writes in {}".format(simulator.storage.sector_writes, simulator.storage.root))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# a backend for seq3.py that talks to the simulator directly instead of going
+# through the fake circuitpython modules, picked with --board host. keys and
+# frames are batched the same as on the boards, but only the midi still costs
+# any time, which leaves the sequencer's own work to look at
+
+import types
+
+
+class HostBackend:
+    def __init__(self, sim):
+        self.sim = sim
+        self.midi_in = sim.midi_in
+        self.midi_out = sim.midi_out
+    
+    def keys_changed(self):
+        return True
+    
+    def read_keys(self):
+        self.sim.button_reads += 1
+        return self.sim.keypad.read()
+    
+    def write_frame(self, frame, changed):
+        self.sim.leds.writes += bin(changed).count("1")
+        self.sim.leds.capture(frame, cost=0)
+
+
+def host_backend_module(sim):
+    module = types.ModuleType("host_backend")
+    module.Backend = lambda: HostBackend(sim)
+    return module
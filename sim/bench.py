@@ -0,0 +1,186 @@
+# step timing benchmarks for seq3.py run against the simulator
+#
+#   python -m sim.bench [script] [--steps 256] > bench_output.txt
+#
+# host times are how long the python code itself takes on this machine, only
+# useful for comparing one revision with another. bus times come from the
+# simulator's model of the i2c, spi and usb transfers, and lateness is how far
+# behind its deadline each step fired on the virtual clock. allocations are
+# measured with tracemalloc and so follow cpython's rules rather than
+# circuitpython's, but anything that allocates on one will on the other.
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from .simulator import Simulator
+
+
+def set_cell(namespace, channel, note, step, value):
+    # go through toggle_note like the keypad does so any indexes stay in sync
+    namespace["channel"] = channel
+    namespace["note"] = note
+    for _ in range(3):
+        if namespace["pattern"].get(channel, note, step) == value:
+            return
+        namespace["toggle_note"](step)
+    raise ValueError("channel {} can't hold {}".format(channel, value))
+
+
+def empty_pattern(namespace):
+    pass
+
+
+def drums_pattern(namespace):
+    for step in range(16):
+        if step % 4 == 0:
+            set_cell(namespace, 9, 0, step, 1)
+        if step % 8 == 4:
+            set_cell(namespace, 9, 1, step, 1)
+        if step % 2 == 0:
+            set_cell(namespace, 9, 6, step, 1)
+
+
+def dense_pattern(namespace):
+    generator = random.Random(16)
+    for channel in range(16):
+        for note in range(16):
+            for step in range(16):
+                roll = generator.random()
+                if roll < 0.5:
+                    set_cell(namespace, channel, note, step, 1)
+                elif roll < 0.7 and channel != 9:
+                    set_cell(namespace, channel, note, step, 2)
+
+
+patterns = [
+    ("empty", empty_pattern),
+    ("drums", drums_pattern),
+    ("dense", dense_pattern),
+]
+
+
+def load(script, fill, board="pico"):
+    # run the script's setup, stopping before its tasks start
+    simulator = Simulator(board=board)
+    namespace = simulator.load(script)
+    fill(namespace)
+    namespace["channel"] = 9
+    namespace["note"] = 0
+    return simulator, namespace
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return [0] * 4
+    
+    def at(fraction):
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+    return [at(0.5), at(0.9), at(0.99), values[-1]]
+
+
+def measure_functions(script, fill, steps, board="pico"):
+    simulator, namespace = load(script, fill, board)
+    calls = {
+        "update_notes": lambda step: namespace["update_notes"](step),
+        "update_leds": lambda step: namespace["update_leds"](),
+        "read_button_states": lambda step: namespace["read_button_states"](),
+    }
+    results = {}
+    for name, call in calls.items():
+        host = []
+        bus = []
+        midi_bytes = []
+        frames = []
+        for i in range(steps):
+            step = i % 16
+            namespace["step"] = step
+            data = simulator.midi_out.count
+            frame_count = simulator.leds.count
+            start = time.perf_counter_ns()
+            virtual = simulator.clock.now
+            call(step)
+            host.append(time.perf_counter_ns() - start)
+            bus.append(simulator.clock.now - virtual)
+            midi_bytes.append(simulator.midi_out.count - data)
+            frames.append(simulator.leds.count - frame_count)
+        
+        # allocations get their own pass as tracing slows everything down, and
+        # the simulator stops recording so only the script's own are counted
+        allocations = []
+        simulator.midi_out.record = False
+        simulator.leds.record = False
+        tracemalloc.start()
+        for i in range(steps):
+            step = i % 16
+            namespace["step"] = step
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            call(step)
+            allocations.append(tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+        simulator.midi_out.record = True
+        simulator.leds.record = True
+        results[name] = (host, bus, midi_bytes, frames, allocations)
+    # the tasks are never started here
+    simulator.main.close()
+    return results
+
+
+def measure_timeline(script, fill, steps, board="pico"):
+    # all of the script's tasks running against the virtual clock, with
+    # next_tick wrapped to note when each step actually fired
+    simulator, namespace = load(script, fill, board)
+    next_tick = namespace["next_tick"]
+    lateness = []
+    fired = []
+    
+    def recorded_next_tick():
+        next_tick()
+        lateness.append(namespace["lateness"])
+        fired.append(simulator.clock.now)
+    
+    namespace["next_tick"] = recorded_next_tick
+    step_length = namespace["step_length"]
+    simulator.clock.end = simulator.clock.now + steps * step_length
+    simulator.run_main()
+    periods = [b - a for a, b in zip(fired, fired[1:])]
+    return lateness, periods, step_length
+
+
+def row(label, values, scale=1000):
+    return "  {:<30}".format(label) + "".join("{:>10.1f}".format(value / scale) for value in values)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m sim.bench", description="benchmark a sequencer's step against the simulator")
+    parser.add_argument("script", nargs="?", default="seq3.py")
+    parser.add_argument("--steps", type=int, default=256)
+    parser.add_argument("--board", choices=["pico", "keybow", "host"], default="pico")
+    args = parser.parse_args()
+    
+    header = "  {:<30}{:>10}{:>10}{:>10}{:>10}".format("", "p50", "p90", "p99", "max")
+    for name, fill in patterns:
+        print("{} pattern, {} steps".format(name, args.steps))
+        print(header)
+        results = measure_functions(args.script, fill, args.steps, args.board)
+        for function, (host, bus, midi_bytes, frames, allocations) in results.items():
+            print(row(function + " host us", percentiles(host)))
+            print(row(function + " bus us", percentiles(bus)))
+        host, bus, midi_bytes, frames, allocations = results["update_notes"]
+        print(row("midi bytes/step", percentiles(midi_bytes), 1))
+        print(row("led frames/step", percentiles(results["update_leds"][3]), 1))
+        for function, (host, bus, midi_bytes, frames, allocations) in results.items():
+            print(row(function + " alloc B", percentiles(allocations), 1))
+        
+        lateness, periods, step_length = measure_timeline(args.script, fill, args.steps, args.board)
+        print(row("step lateness us", percentiles(lateness)))
+        jitter = [abs(period - step_length) for period in periods]
+        print(row("period jitter us", percentiles(jitter)))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# virtual clock standing in for circuitpython's time module
+# time only moves when the script sleeps or touches the (simulated) hardware,
+# so a run is completely deterministic no matter how fast the host is
+
+import asyncio
+import math
+import selectors
+import types
+
+
+class StopSimulation(Exception):
+    pass
+
+
+class VirtualClock:
+    def __init__(self, duration=None, read_cost=1000):
+        self.now = 0
+        self.end = None if duration is None else int(duration * 1000000000)
+        # reading the clock costs a little so busy loops still move forward
+        self.read_cost = read_cost
+    
+    def advance(self, nanoseconds):
+        if nanoseconds > 0:
+            self.now += int(nanoseconds)
+        if self.end is not None and self.now >= self.end:
+            # only stop once, anything tidying up afterwards can carry on
+            self.end = None
+            raise StopSimulation()
+    
+    def monotonic_ns(self):
+        self.advance(self.read_cost)
+        return self.now
+    
+    def monotonic(self):
+        return self.monotonic_ns() / 1000000000
+    
+    def sleep(self, seconds):
+        self.advance(seconds * 1000000000)
+    
+    def module(self):
+        time = types.ModuleType("time")
+        time.monotonic = self.monotonic
+        time.monotonic_ns = self.monotonic_ns
+        time.sleep = self.sleep
+        time.time = lambda: self.now // 1000000000
+        return time
+
+
+class VirtualSelector(selectors.SelectSelector):
+    # instead of blocking for the timeout, jump the clock forward by it
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+    
+    def select(self, timeout=None):
+        if timeout is None:
+            # nothing is scheduled so time would stand still forever
+            raise StopSimulation()
+        # rounded up or float error can leave a timer forever a nanosecond away
+        self.clock.advance(math.ceil(timeout * 1000000000))
+        return super().select(0)
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock):
+        super().__init__(VirtualSelector(clock))
+        self.clock = clock
+    
+    def time(self):
+        return self.clock.now / 1000000000
+
+
+class VirtualEventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+    # makes asyncio.run in the script use the virtual clock
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+    
+    def new_event_loop(self):
+        return VirtualEventLoop(self.clock)
@@ -0,0 +1,84 @@
+# checks seq3.py keeps its timeline steady while following a midi clock,
+# sent into it at a steady tempo the way a daw would
+#
+#   python -m sim.follow [script] [--seconds 40] [--bpm 120]
+#
+# the script re-estimates the step length on every pulse, so anything timed
+# from its start time in between the step pulses has to stay put as it does.
+# the error is where the timeline puts the step that's playing against when
+# its pulse actually arrived, checked after every pulse. the swung phase is
+# how far into their steps the kicks on every other step are sent with the
+# swing at 66, which is 0.3125 of a step at any tempo. a note is also played
+# in with recording on 0.36 of a step after step 8 every bar, each on its
+# own note, and should be put on step 8 every time
+
+import argparse
+import bisect
+
+from .bench import percentiles, row, set_cell
+from .simulator import Simulator
+
+
+def measure_timeline(script, seconds, bpm):
+    simulator = Simulator(duration=seconds)
+    simulator.send_clock(bpm, 0.5)
+    namespace = simulator.load(script)
+    for step in range(16):
+        set_cell(namespace, 9, 0, step, 1)
+    namespace["set_swing"](66)
+    namespace["channel"] = 0
+    namespace["toggle_recording"]()
+    step_time = 60 / bpm / 4
+    bars = []
+    while len(bars) < 16 and 0.5 + (len(bars) * 16 + 9) * step_time < seconds:
+        start = 0.5 + (len(bars) * 16 + 8.36) * step_time
+        simulator.send_midi(bytes([0x90, 36 + len(bars), 100]), start)
+        simulator.send_midi(bytes([0x80, 36 + len(bars), 0]), start + step_time / 4)
+        bars.append(start)
+    clock_pulse = namespace["clock_pulse"]
+    pulses = []
+    errors = []
+    
+    def recorded_clock_pulse(now):
+        tick = namespace["tick"]
+        clock_pulse(now)
+        if namespace["tick"] != tick:
+            pulses.append(now)
+        if pulses and namespace["tick"] >= 1:
+            errors.append(namespace["start_time"] + (namespace["tick"] - 1) * namespace["step_length"] - pulses[-1])
+    
+    namespace["clock_pulse"] = recorded_clock_pulse
+    simulator.run_main()
+    
+    # the kicks against the step pulse they came after, the swung ones on
+    # odd ticks as the first pulse is tick 0
+    phases = []
+    for time, status, data1, data2 in simulator.midi_messages():
+        if status != 0x99 or not data2:
+            continue
+        i = bisect.bisect_right(pulses, time) - 1
+        if i >= 0 and i % 2 and i + 1 < len(pulses):
+            phases.append((time - pulses[i]) / (pulses[i + 1] - pulses[i]))
+    
+    pattern = namespace["pattern"]
+    recorded = [[step for step in range(16) if pattern.get(0, note, step)] for note in range(len(bars))]
+    return errors, phases, recorded, pulses
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m sim.follow", description="check a sequencer keeps time following midi clock")
+    parser.add_argument("script", nargs="?", default="seq3.py")
+    parser.add_argument("--seconds", type=float, default=40.0)
+    parser.add_argument("--bpm", type=float, default=120.0)
+    args = parser.parse_args()
+    
+    errors, phases, recorded, pulses = measure_timeline(args.script, args.seconds, args.bpm)
+    print("{} bpm clock, {} steps".format(args.bpm, len(pulses)))
+    print("  {:<30}{:>10}{:>10}{:>10}{:>10}".format("", "p50", "p90", "p99", "max"))
+    print(row("timeline error us", percentiles([abs(error) for error in errors])))
+    print(row("swung phase %", percentiles([phase * 100 for phase in phases]), 1))
+    print("  recorded on step 8: {} of {}, {}".format(recorded.count([8]), len(recorded), recorded))
+
+
+if __name__ == "__main__":
+    main()
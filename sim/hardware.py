@@ -0,0 +1,557 @@
+# fake versions of the circuitpython modules the sequencers import
+# each fake charges the virtual clock roughly what the real bus transfer
+# costs on an rp2040 so timing measurements mean something
+
+import bisect
+import errno
+import math
+import os
+import types
+
+
+# rough costs in nanoseconds
+I2C_TRANSACTION_COST = 250000
+SPI_FRAME_COST = 60000
+USB_WRITE_COST = 20000
+USB_BYTE_COST = 300
+# erasing and rewriting a 4k flash sector, the whole chip stalls meanwhile
+FLASH_SECTOR_COST = 45000000
+
+
+class Pin:
+    def __init__(self, name):
+        self.name = name
+    
+    def __repr__(self):
+        return "board." + self.name
+
+
+class Keypad:
+    # the 16 buttons of a simulated pad, driven from a script of timed presses
+    def __init__(self, clock):
+        self.clock = clock
+        self.events = []
+        self.states = 0
+        self.last_read = 0
+    
+    def press(self, key, at, hold=0.05):
+        self.events.append((int(at * 1000000000), key, True))
+        self.events.append((int((at + hold) * 1000000000), key, False))
+        self.events.sort()
+    
+    def read(self):
+        while self.events and self.events[0][0] <= self.clock.now:
+            _, key, down = self.events.pop(0)
+            if down:
+                self.states |= 1 << key
+            else:
+                self.states &= ~(1 << key)
+        return self.states
+    
+    @property
+    def interrupt(self):
+        # active low like the tca9555, held until the inputs are read
+        return self.read() == self.last_read
+
+
+class LedFrames:
+    # every frame pushed out to the leds, along with when it was sent
+    def __init__(self, clock):
+        self.clock = clock
+        self.frames = []
+        self.writes = 0
+        self.count = 0
+        self.record = True
+    
+    def capture(self, pixels, cost=SPI_FRAME_COST):
+        self.clock.advance(cost)
+        self.count += 1
+        if self.record:
+            self.frames.append((self.clock.now, tuple(pixels)))
+
+
+class MidiOut:
+    def __init__(self, clock):
+        self.clock = clock
+        self.data = bytearray()
+        self.writes = []
+        self.count = 0
+        self.record = True
+    
+    def write(self, buf, length=None):
+        length = len(buf) if length is None else length
+        self.clock.advance(USB_WRITE_COST + USB_BYTE_COST * length)
+        self.count += length
+        if self.record:
+            data = bytes(buf[:length])
+            self.writes.append((self.clock.now, data))
+            self.data.extend(data)
+        return length
+
+
+class MidiIn:
+    def __init__(self, clock):
+        self.clock = clock
+        self.pending = []
+        self.queued = 0
+        self.buffer = bytearray()
+    
+    def queue(self, data, at):
+        # messages queued for the same time arrive in the order they were sent
+        self.queued += 1
+        bisect.insort(self.pending, (int(at * 1000000000), self.queued, bytes(data)))
+    
+    def receive(self):
+        while self.pending and self.pending[0][0] <= self.clock.now:
+            self.buffer.extend(self.pending.pop(0)[2])
+    
+    def read(self, nbytes=1):
+        self.receive()
+        data = bytes(self.buffer[:nbytes])
+        del self.buffer[:nbytes]
+        return data
+    
+    def readinto(self, buf, nbytes=None):
+        self.receive()
+        count = min(len(buf) if nbytes is None else nbytes, len(self.buffer))
+        if not count:
+            return None
+        buf[:count] = self.buffer[:count]
+        del self.buffer[:count]
+        return count
+
+
+class Storage:
+    # the CIRCUITPY drive, kept in a directory on the host
+    def __init__(self, clock, root, readonly=False):
+        self.clock = clock
+        self.root = root
+        self.readonly = readonly
+        self.sector_writes = 0
+    
+    def path(self, path):
+        return os.path.join(self.root, path.lstrip("/"))
+    
+    def check_writable(self):
+        if self.readonly:
+            raise OSError(errno.EROFS, "Read-only filesystem")
+    
+    def write_sectors(self, count):
+        self.clock.advance(FLASH_SECTOR_COST * count)
+        self.sector_writes += count
+    
+    def open(self, path, mode="r", *args, **kwargs):
+        if any(flag in mode for flag in "wax+"):
+            self.check_writable()
+            return StorageFile(self, open(self.path(path), mode, *args, **kwargs))
+        return open(self.path(path), mode, *args, **kwargs)
+
+
+class StorageFile:
+    # writes sit in the sector cache until a flush or close, just like
+    # circuitpython, and are charged to the clock then
+    def __init__(self, storage, file):
+        self.storage = storage
+        self.file = file
+        self.unflushed = 0
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    def write(self, data):
+        count = self.file.write(data)
+        self.unflushed += count
+        return count
+    
+    def flush(self):
+        self.file.flush()
+        if self.unflushed:
+            # the data plus the file allocation table
+            self.storage.write_sectors(math.ceil(self.unflushed / 4096) + 1)
+            self.unflushed = 0
+    
+    def close(self):
+        self.flush()
+        # and the directory entry
+        self.storage.write_sectors(1)
+        self.file.close()
+
+
+def board_module(sim):
+    board = types.ModuleType("board")
+    
+    def __getattr__(name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return Pin(name)
+    
+    board.__getattr__ = __getattr__
+    board.board_id = sim.board_id
+    board.I2C = lambda: I2C(Pin("SCL"), Pin("SDA"))
+    return board
+
+
+def digitalio_module(sim):
+    digitalio = types.ModuleType("digitalio")
+    
+    class Direction:
+        INPUT = "input"
+        OUTPUT = "output"
+    
+    class Pull:
+        UP = "up"
+        DOWN = "down"
+    
+    class DigitalInOut:
+        def __init__(self, pin):
+            self.pin = pin
+            self.direction = Direction.INPUT
+            self.pull = None
+            self.output = False
+        
+        @property
+        def value(self):
+            if self.direction == Direction.OUTPUT:
+                return self.output
+            if self.pin.name in sim.pins:
+                return sim.pins[self.pin.name]()
+            return self.pull == Pull.UP
+        
+        @value.setter
+        def value(self, value):
+            self.output = bool(value)
+        
+        def deinit(self):
+            pass
+    
+    digitalio.Direction = Direction
+    digitalio.Pull = Pull
+    digitalio.DigitalInOut = DigitalInOut
+    return digitalio
+
+
+class I2C:
+    def __init__(self, scl, sda, frequency=100000):
+        self.scl = scl
+        self.sda = sda
+    
+    def deinit(self):
+        pass
+
+
+def busio_module(sim):
+    busio = types.ModuleType("busio")
+    busio.I2C = I2C
+    return busio
+
+
+def i2c_device_module(sim):
+    i2c_device = types.ModuleType("adafruit_bus_device.i2c_device")
+    
+    class I2CDevice:
+        # behaves like the tca9555 expander on the pico rgb keypad base
+        def __init__(self, i2c, device_address):
+            self.address = device_address
+            self.register = 0
+        
+        def __enter__(self):
+            return self
+        
+        def __exit__(self, *args):
+            return False
+        
+        def write(self, buf, start=0, end=None):
+            sim.clock.advance(I2C_TRANSACTION_COST)
+            self.register = buf[start]
+        
+        def readinto(self, buf, start=0, end=None):
+            sim.clock.advance(I2C_TRANSACTION_COST)
+            states = sim.keypad.read()
+            sim.keypad.last_read = states
+            sim.button_reads += 1
+            # pressed buttons pull their input low
+            inputs = ~states & 0xFFFF
+            end = len(buf) if end is None else end
+            for i in range(start, end):
+                register = self.register + i - start
+                buf[i] = inputs >> (8 * register) & 0xFF if register < 2 else 0
+        
+        def write_then_readinto(self, out_buffer, in_buffer, **kwargs):
+            self.write(out_buffer)
+            self.readinto(in_buffer)
+    
+    i2c_device.I2CDevice = I2CDevice
+    bus_device = types.ModuleType("adafruit_bus_device")
+    bus_device.i2c_device = i2c_device
+    return bus_device, i2c_device
+
+
+def dotstar_module(sim):
+    adafruit_dotstar = types.ModuleType("adafruit_dotstar")
+    
+    class DotStar:
+        def __init__(self, clock, data, n, brightness=1.0, auto_write=True, **kwargs):
+            self.pixels = [(0, 0, 0)] * n
+            self.brightness = brightness
+            self.auto_write = auto_write
+        
+        def __len__(self):
+            return len(self.pixels)
+        
+        def __getitem__(self, index):
+            return self.pixels[index]
+        
+        def __setitem__(self, index, color):
+            self.pixels[index] = tuple(color)
+            sim.leds.writes += 1
+            if self.auto_write:
+                self.show()
+        
+        def fill(self, color):
+            self.pixels = [tuple(color)] * len(self.pixels)
+            if self.auto_write:
+                self.show()
+        
+        def show(self):
+            sim.leds.capture(self.pixels)
+    
+    adafruit_dotstar.DotStar = DotStar
+    return adafruit_dotstar
+
+
+def usb_midi_module(sim):
+    usb_midi = types.ModuleType("usb_midi")
+    usb_midi.ports = (sim.midi_in, sim.midi_out)
+    return usb_midi
+
+
+def keybow_module(sim):
+    keybow2040 = types.ModuleType("keybow2040")
+    
+    class Key:
+        def __init__(self, number):
+            self.number = number
+            self.rgb = (0, 0, 0)
+            self.press_function = None
+            self.release_function = None
+        
+        def get_state(self):
+            # the keys are gpio pins so reading one costs next to nothing
+            return sim.keypad.read() >> self.number & 1
+        
+        def set_led(self, r, g, b):
+            self.rgb = (r, g, b)
+            sim.leds.writes += 1
+    
+    class Keybow2040:
+        def __init__(self, i2c):
+            self.keys = [Key(i) for i in range(16)]
+            self.last_states = 0
+        
+        def update(self):
+            sim.clock.advance(I2C_TRANSACTION_COST)
+            states = sim.keypad.read()
+            sim.button_reads += 1
+            changed = states ^ self.last_states
+            for key in self.keys:
+                if changed >> key.number & 1:
+                    if states >> key.number & 1:
+                        if key.press_function:
+                            key.press_function(key)
+                    elif key.release_function:
+                        key.release_function(key)
+            self.last_states = states
+            sim.leds.capture([key.rgb for key in self.keys])
+        
+        def get_states(self):
+            return [key.get_state() for key in self.keys]
+        
+        def on_press(self, key, handler=None):
+            def attach(handler):
+                key.press_function = handler
+                return handler
+            return attach if handler is None else attach(handler)
+        
+        def on_release(self, key, handler=None):
+            def attach(handler):
+                key.release_function = handler
+                return handler
+            return attach if handler is None else attach(handler)
+    
+    keybow2040.Keybow2040 = Keybow2040
+    return keybow2040
+
+
+def os_module(sim):
+    # the parts of circuitpython's os that touch the drive
+    module = types.ModuleType("os")
+    storage = sim.storage
+    module.sep = "/"
+    module.listdir = lambda path="/": os.listdir(storage.path(path))
+    module.stat = lambda path: tuple(os.stat(storage.path(path)))
+    
+    def mkdir(path):
+        storage.check_writable()
+        os.mkdir(storage.path(path))
+        storage.write_sectors(1)
+    
+    def remove(path):
+        storage.check_writable()
+        os.remove(storage.path(path))
+        storage.write_sectors(1)
+    
+    def rename(old_path, new_path):
+        storage.check_writable()
+        if os.path.exists(storage.path(new_path)):
+            # fat won't rename over an existing file
+            raise OSError(errno.EEXIST, "File exists")
+        os.rename(storage.path(old_path), storage.path(new_path))
+        storage.write_sectors(1)
+    
+    module.mkdir = mkdir
+    module.remove = remove
+    module.rename = rename
+    module.urandom = os.urandom
+    module.getenv = lambda key, default=None: default
+    return module
+
+
+def gc_module(sim):
+    gc = types.ModuleType("gc")
+    
+    def collect():
+        sim.gc_collections += 1
+    
+    gc.collect = collect
+    gc.mem_free = lambda: sim.heap_size
+    gc.mem_alloc = lambda: 0
+    gc.enable = lambda: None
+    gc.disable = lambda: None
+    return gc
+
+
+def adafruit_midi_modules(sim):
+    # just enough of adafruit_midi for the scripts that still use it
+    modules = {}
+    
+    def message_module(name, cls):
+        module = types.ModuleType("adafruit_midi." + name)
+        setattr(module, cls.__name__, cls)
+        modules[module.__name__] = module
+    
+    def note_number(note):
+        if isinstance(note, int):
+            return note
+        names = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+        number = names[note[0].upper()]
+        octave = note[1:]
+        if octave.startswith("#"):
+            number += 1
+            octave = octave[1:]
+        elif octave.startswith("b"):
+            number -= 1
+            octave = octave[1:]
+        return number + (int(octave) + 1) * 12
+    
+    class MIDIMessage:
+        status = 0x00
+        channel = None
+        
+        def data(self):
+            return ()
+        
+        def __bytes__(self):
+            channel = self.channel or 0
+            return bytes((self.status | channel,) + self.data())
+    
+    class NoteOn(MIDIMessage):
+        status = 0x90
+        
+        def __init__(self, note, velocity=127, *, channel=None):
+            self.note = note_number(note)
+            self.velocity = velocity
+            self.channel = channel
+        
+        def data(self):
+            return (self.note, self.velocity)
+    
+    class NoteOff(NoteOn):
+        status = 0x80
+        
+        def __init__(self, note, velocity=0, *, channel=None):
+            super().__init__(note, velocity, channel=channel)
+    
+    class ControlChange(MIDIMessage):
+        status = 0xB0
+        
+        def __init__(self, control, value, *, channel=None):
+            self.control = control
+            self.value = value
+            self.channel = channel
+        
+        def data(self):
+            return (self.control, self.value)
+    
+    class PitchBend(MIDIMessage):
+        status = 0xE0
+        
+        def __init__(self, pitch_bend, *, channel=None):
+            self.pitch_bend = pitch_bend
+            self.channel = channel
+        
+        def data(self):
+            return (self.pitch_bend & 0x7F, self.pitch_bend >> 7)
+    
+    class Start(MIDIMessage):
+        status = 0xFA
+    
+    class Stop(MIDIMessage):
+        status = 0xFC
+    
+    class Continue(MIDIMessage):
+        status = 0xFB
+    
+    realtime = {0xFA: Start, 0xFB: Continue, 0xFC: Stop}
+    
+    class MIDI:
+        def __init__(self, midi_in=None, midi_out=None, *, in_channel=None, out_channel=0, **kwargs):
+            self.midi_in = midi_in
+            self.midi_out = midi_out
+            self.in_channel = in_channel
+            self.out_channel = out_channel
+        
+        def send(self, msg, channel=None):
+            for message in msg if isinstance(msg, list) else [msg]:
+                if message.channel is None:
+                    message.channel = self.out_channel if channel is None else channel
+                self.midi_out.write(bytes(message))
+        
+        def receive(self):
+            # only realtime and note messages are understood
+            data = self.midi_in.read(1) if self.midi_in else b""
+            if not data:
+                return None
+            status = data[0]
+            if status in realtime:
+                return realtime[status]()
+            if status & 0xE0 == 0x80:
+                note, velocity = self.midi_in.read(2)
+                cls = NoteOn if status & 0xF0 == 0x90 else NoteOff
+                return cls(note, velocity, channel=status & 0x0F)
+            return None
+    
+    package = types.ModuleType("adafruit_midi")
+    package.MIDI = MIDI
+    package.MIDIMessage = MIDIMessage
+    modules["adafruit_midi"] = package
+    message_module("note_on", NoteOn)
+    message_module("note_off", NoteOff)
+    message_module("control_change", ControlChange)
+    message_module("pitch_bend", PitchBend)
+    message_module("start", Start)
+    message_module("stop", Stop)
+    message_module("midi_continue", Continue)
+    return modules
@@ -0,0 +1,176 @@
+# runs a circuitpython script on the host against the fake hardware
+# the script is executed until the virtual clock reaches the requested
+# duration, after which its globals are kept around for inspection
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import types
+from contextlib import contextmanager
+
+from . import hardware
+from .backend import host_backend_module
+from .clock import StopSimulation, VirtualClock, VirtualEventLoopPolicy
+
+
+# what board.board_id reads for each board backends.py knows about
+BOARD_IDS = {
+    "pico": "raspberry_pi_pico",
+    "keybow": "pimoroni_keybow2040",
+    "host": "host",
+}
+
+
+class Simulator:
+    def __init__(self, duration=None, heap_size=160000, seed=0, storage=None, readonly=False, board="pico"):
+        self.clock = VirtualClock(duration)
+        self.board_id = BOARD_IDS[board]
+        # a fresh empty drive unless given a directory to keep it in
+        self.storage = hardware.Storage(self.clock, storage or tempfile.mkdtemp(prefix="circuitpy-"), readonly)
+        self.keypad = hardware.Keypad(self.clock)
+        self.leds = hardware.LedFrames(self.clock)
+        self.midi_in = hardware.MidiIn(self.clock)
+        self.midi_out = hardware.MidiOut(self.clock)
+        # input pins the script can read, by board pin name
+        self.pins = {"GP3": lambda: self.keypad.interrupt}
+        # the keybow's keys are pins of their own, pulled up
+        for i in range(16):
+            self.pins["SW" + str(i)] = lambda i=i: not self.keypad.read() >> i & 1
+        self.heap_size = heap_size
+        self.seed = seed
+        self.button_reads = 0
+        self.gc_collections = 0
+        self.namespace = {}
+        self.main = None
+    
+    def press(self, key, at, hold=0.05):
+        self.keypad.press(key, at, hold)
+    
+    def send_midi(self, data, at):
+        self.midi_in.queue(data, at)
+    
+    def send_clock(self, bpm, start, stop=None):
+        # start, 24 pulses per quarter note and then stop, like a daw
+        # with clock sync turned on
+        self.send_midi(b"\xfa", start)
+        interval = 60 / bpm / 24
+        end = stop if stop is not None else self.clock.end / 1000000000
+        pulse = 0
+        while start + pulse * interval < end:
+            self.send_midi(b"\xf8", start + pulse * interval)
+            pulse += 1
+        if stop is not None:
+            self.send_midi(b"\xfc", stop)
+    
+    def modules(self):
+        bus_device, i2c_device = hardware.i2c_device_module(self)
+        modules = {
+            "time": self.clock.module(),
+            "os": hardware.os_module(self),
+            "gc": hardware.gc_module(self),
+            "board": hardware.board_module(self),
+            "digitalio": hardware.digitalio_module(self),
+            "busio": hardware.busio_module(self),
+            "adafruit_bus_device": bus_device,
+            "adafruit_bus_device.i2c_device": i2c_device,
+            "adafruit_dotstar": hardware.dotstar_module(self),
+            "usb_midi": hardware.usb_midi_module(self),
+            "keybow2040": hardware.keybow_module(self),
+            "host_backend": host_backend_module(self),
+        }
+        modules.update(hardware.adafruit_midi_modules(self))
+        return modules
+    
+    def asyncio_module(self):
+        # asyncio as normal except that run() hands the coroutine back
+        # instead of starting it, so the script stops once it's set up
+        module = types.ModuleType("asyncio")
+        module.__dict__.update(asyncio.__dict__)
+        
+        def run(main):
+            self.main = main
+            raise StopSimulation()
+        
+        module.run = run
+        return module
+    
+    @contextmanager
+    def installed(self, path=None, stop_at_main=False):
+        # swap the fakes into sys.modules just for the duration of the run
+        fakes = self.modules()
+        if stop_at_main:
+            fakes["asyncio"] = self.asyncio_module()
+        saved = {name: sys.modules.get(name) for name in fakes}
+        loaded = set(sys.modules)
+        sys.modules.update(fakes)
+        policy = asyncio.get_event_loop_policy()
+        asyncio.set_event_loop_policy(VirtualEventLoopPolicy(self.clock))
+        if path:
+            sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+        try:
+            yield
+        finally:
+            asyncio.set_event_loop_policy(policy)
+            if path:
+                sys.path.pop(0)
+            for name, module in saved.items():
+                if module is None:
+                    del sys.modules[name]
+                else:
+                    sys.modules[name] = module
+            # anything the script imported from next to it, like backends.py,
+            # holds on to this run's fakes so it's imported afresh next time
+            for name in set(sys.modules) - loaded:
+                origin = getattr(sys.modules[name], "__file__", None) or ""
+                if not origin.startswith((sys.prefix, sys.base_prefix, os.path.dirname(__file__))):
+                    del sys.modules[name]
+    
+    def run(self, path, stop_at_main=False):
+        with open(path) as file:
+            code = compile(file.read(), path, "exec")
+        
+        random.seed(self.seed)
+        self.namespace = {"__name__": "__main__", "__file__": path, "open": self.storage.open}
+        with self.installed(path, stop_at_main):
+            try:
+                exec(code, self.namespace)
+            except StopSimulation:
+                pass
+        return self.namespace
+    
+    def load(self, path):
+        # runs the script's setup, leaving its main coroutine in self.main
+        return self.run(path, stop_at_main=True)
+    
+    def run_main(self):
+        # carries on a loaded script until the clock runs out
+        with self.installed():
+            try:
+                asyncio.run(self.main)
+            except StopSimulation:
+                pass
+    
+    def midi_messages(self):
+        # the output stream decoded into (time, status, data1, data2),
+        # data2 is None for two byte messages and both are for realtime ones
+        messages = []
+        status = 0
+        data = []
+        for time, chunk in self.midi_out.writes:
+            for byte in chunk:
+                if byte >= 0xF8:
+                    messages.append((time, byte, None, None))
+                elif byte & 0x80:
+                    status = byte
+                    data = []
+                    if byte >= 0xF0:
+                        messages.append((time, byte, None, None))
+                else:
+                    data.append(byte)
+                    length = 1 if status & 0xE0 == 0xC0 else 2
+                    if len(data) == length:
+                        messages.append((time, status, data[0], data[1] if length == 2 else None))
+                        data = []
+        return messages
@@ -0,0 +1,62 @@
+# precompiles seq3.py and backends.py to .mpy so the board doesn't have to
+# compile 1600 lines of python every time it starts or reloads, leaving a
+# two line code.py that imports the compiled sequencer
+#
+#   python tools/mpy.py -o build
+#   python tools/mpy.py -o /Volumes/CIRCUITPY --mpy-cross ~/bin/mpy-cross-7.1
+#
+# needs the mpy-cross matching the board's circuitpython version, from
+# https://adafruit-circuit-python.s3.amazonaws.com/index.html?prefix=bin/mpy-cross
+# the drive has to be writable from the computer to copy straight to it, see
+# boot.py. the old seq3.py is removed from the output if it's there as python
+# would pick it over the .mpy
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["seq3.py", "backends.py"]
+# copied as they are, boot.py runs before anything could be imported from
+# a .mpy and is only a few lines anyway
+COPIED = ["boot.py"]
+CODE = """# runs the precompiled seq3.mpy, built by tools/mpy.py
+import seq3
+"""
+
+
+def compile_module(mpy_cross, source, output):
+    target = os.path.join(output, os.path.splitext(os.path.basename(source))[0] + ".mpy")
+    # -s keeps tracebacks pointing at the right file name
+    result = subprocess.run([mpy_cross, "-s", os.path.basename(source), "-o", target, source],
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise SystemExit("mpy-cross failed on {}:\n{}".format(source, result.stderr))
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="precompile the sequencer for circuitpython")
+    parser.add_argument("-o", "--output", default="build", help="directory or drive to write to")
+    parser.add_argument("--mpy-cross", default="mpy-cross", help="the mpy-cross to compile with")
+    args = parser.parse_args()
+    
+    if shutil.which(args.mpy_cross) is None:
+        sys.exit("can't find {}, see the top of {}".format(args.mpy_cross, os.path.relpath(__file__)))
+    os.makedirs(args.output, exist_ok=True)
+    for name in MODULES:
+        target = compile_module(args.mpy_cross, os.path.join(ROOT, name), args.output)
+        stale = os.path.join(args.output, name)
+        if os.path.exists(stale):
+            os.remove(stale)
+        print("{}: {} bytes".format(os.path.relpath(target), os.path.getsize(target)))
+    for name in COPIED:
+        shutil.copy(os.path.join(ROOT, name), args.output)
+    with open(os.path.join(args.output, "code.py"), "w") as file:
+        file.write(CODE)
+
+
+if __name__ == "__main__":
+    main()
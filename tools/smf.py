@@ -0,0 +1,437 @@
+# converts seq3.py's saved patterns to and from standard midi files
+#
+#   python tools/smf.py export /Volumes/CIRCUITPY/patterns --slot 0 -o beat.mid
+#   python tools/smf.py export /Volumes/CIRCUITPY/patterns --song -o set.mid
+#   python tools/smf.py import beat.mid /Volumes/CIRCUITPY/patterns --slot 4
+#
+# exports are type 1 files, a tempo track then a track per channel, each
+# written out as it's generated so a long song only ever needs the patterns
+# it uses in memory. imports quantize to 16th note steps and the nearest of
+# the sequencer's velocity levels, keep how far off the grid each step's
+# first note was as its nudge, keep notes 36 to 51 and split anything
+# longer than a pattern across consecutive slots along with a song.txt to
+# play them in order.
+# the drive is read only to the computer unless the top left button was held
+# while plugging the keypad in, see boot.py
+
+import argparse
+import os
+import struct
+import sys
+from array import array
+
+# the same layout seq3.py saves, the masks are little endian. the header's
+# last byte is the version, each one adding lanes to the end of the last
+HEADER = b"SEQ3"
+VERSION = 4
+CHANNELS = 16
+NOTES = 16
+STEPS = 64
+FIRST_NOTE = 36
+DRUM_CHANNEL = 9
+VERSION_SIZES = {
+    1: len(HEADER) + 1 + CHANNELS + 4 * CHANNELS * STEPS,
+    2: len(HEADER) + 1 + CHANNELS + 4 * CHANNELS * STEPS + CHANNELS * STEPS // 8 + CHANNELS * STEPS + CHANNELS * NOTES * STEPS // 2,
+}
+VERSION_SIZES[3] = VERSION_SIZES[2] + CHANNELS * STEPS
+VERSION_SIZES[4] = VERSION_SIZES[3] + CHANNELS
+
+# step lengths are 16th notes, split into the same 96ths as the nudges
+TICKS_PER_BEAT = 384
+TICKS_PER_STEP = TICKS_PER_BEAT // 4
+SUBDIVISIONS = 96
+# the nudges the sequencer can set, which keep a channel's steps in order
+EARLIEST_NUDGE = -12
+LATEST_NUDGE = 24
+
+VELOCITY_LEVELS = [8, 16, 24, 32, 40, 48, 56, 64, 72, 80, 88, 96, 104, 112, 120, 127]
+DEFAULT_VELOCITY_LEVEL = 14
+ACCENT_BOOST = 24
+
+
+class Pattern:
+    def __init__(self):
+        self.lengths = bytearray([16] * CHANNELS)
+        self.on_masks = array('H', [0] * (CHANNELS * STEPS))
+        self.held_masks = array('H', [0] * (CHANNELS * STEPS))
+        self.accents = bytearray(CHANNELS * STEPS // 8)
+        self.chances = bytearray([100] * (CHANNELS * STEPS))
+        self.velocities = bytearray([DEFAULT_VELOCITY_LEVEL * 17] * (CHANNELS * NOTES * STEPS // 2))
+        self.nudges = array('b', [0] * (CHANNELS * STEPS))
+        self.gates = bytearray([100] * CHANNELS)
+    
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            data = file.read()
+        version = data[len(HEADER)] if len(data) > len(HEADER) else 0
+        if not data.startswith(HEADER) or VERSION_SIZES.get(version) != len(data):
+            raise ValueError("{} isn't a saved pattern".format(path))
+        pattern = cls()
+        offset = len(HEADER) + 1
+        pattern.lengths[:] = data[offset:offset + CHANNELS]
+        offset += CHANNELS
+        masks = 2 * CHANNELS * STEPS
+        pattern.on_masks = array('H')
+        pattern.on_masks.frombytes(data[offset:offset + masks])
+        pattern.held_masks = array('H')
+        pattern.held_masks.frombytes(data[offset + masks:offset + 2 * masks])
+        if sys.byteorder == "big":
+            pattern.on_masks.byteswap()
+            pattern.held_masks.byteswap()
+        offset += 2 * masks
+        if version >= 2:
+            for lane in (pattern.accents, pattern.chances, pattern.velocities):
+                lane[:] = data[offset:offset + len(lane)]
+                offset += len(lane)
+        if version >= 3:
+            pattern.nudges = array('b', data[offset:offset + CHANNELS * STEPS])
+            offset += CHANNELS * STEPS
+        if version >= 4:
+            pattern.gates[:] = data[offset:offset + CHANNELS]
+        return pattern
+    
+    def save(self, path):
+        on_masks = array('H', self.on_masks)
+        held_masks = array('H', self.held_masks)
+        if sys.byteorder == "big":
+            on_masks.byteswap()
+            held_masks.byteswap()
+        with open(path, "wb") as file:
+            file.write(HEADER + bytes((VERSION,)))
+            file.write(self.lengths)
+            file.write(on_masks.tobytes())
+            file.write(held_masks.tobytes())
+            file.write(self.accents)
+            file.write(self.chances)
+            file.write(self.velocities)
+            file.write(self.nudges.tobytes())
+            file.write(self.gates)
+    
+    def on_mask(self, channel, step):
+        return self.on_masks[channel * STEPS + step]
+    
+    def held_mask(self, channel, step):
+        return self.held_masks[channel * STEPS + step]
+    
+    def velocity(self, channel, note, step):
+        # what the sequencer sends, accent and all
+        index = (channel * STEPS + step) * NOTES + note
+        level = self.velocities[index >> 1] >> ((index & 1) << 2) & 15
+        accent = self.accents[(channel * STEPS + step) >> 3] >> ((channel * STEPS + step) & 7) & 1
+        return min(VELOCITY_LEVELS[level] + (ACCENT_BOOST if accent else 0), 127)
+    
+    def set(self, channel, note, step, on, velocity=None):
+        bit = 1 << note
+        if on:
+            self.on_masks[channel * STEPS + step] |= bit
+        self.held_masks[channel * STEPS + step] |= bit
+        if velocity is not None:
+            level = min(range(16), key=lambda level: abs(VELOCITY_LEVELS[level] - velocity))
+            index = (channel * STEPS + step) * NOTES + note
+            shift = (index & 1) << 2
+            self.velocities[index >> 1] = self.velocities[index >> 1] & ~(15 << shift) | level << shift
+    
+    def nudge(self, channel, step):
+        return min(max(self.nudges[channel * STEPS + step], EARLIEST_NUDGE), LATEST_NUDGE)
+    
+    def bar(self):
+        # how long it plays for in song mode, the longest channel
+        return max(self.lengths)
+
+
+def slot_path(directory, slot):
+    # seq3.py falls back on the new file if power went mid save
+    path = os.path.join(directory, "{}.bin".format(slot))
+    if not os.path.exists(path):
+        new_path = os.path.join(directory, "{}.new".format(slot))
+        if os.path.exists(new_path):
+            return new_path
+    return path
+
+
+def read_song(directory):
+    song = []
+    with open(os.path.join(directory, "song.txt")) as file:
+        for line in file:
+            fields = line.split("#")[0].split()
+            if fields:
+                song.append((int(fields[0]) & 15, int(fields[1]) if len(fields) > 1 else 1))
+    return song
+
+
+# export
+
+def segments(directory, entries):
+    # (pattern, steps) for each bank in turn, loading each slot just once
+    patterns = {}
+    for slot, repeats in entries:
+        if slot not in patterns:
+            patterns[slot] = Pattern.load(slot_path(directory, slot))
+        pattern = patterns[slot]
+        yield pattern, pattern.bar() * repeats
+
+
+def channel_events(channel, banks, swing=50):
+    # (tick, message) for one channel, notes start on their on steps and carry
+    # on through held steps until a step that doesn't hold them or plays them
+    # again, the same as the sequencer sends them. steps with a chance of
+    # playing are always played, each step is moved by its nudge and every
+    # other one by the swing, and a gate shorter than the step ends the notes
+    # part way through their last step
+    swing_delay = (2 * swing - 100) * SUBDIVISIONS // 100
+    sounding = 0
+    time = 0
+    for pattern, steps in banks:
+        length = pattern.lengths[channel]
+        gate = pattern.gates[channel]
+        for i in range(steps):
+            step = i % length
+            on = pattern.on_mask(channel, step)
+            held = pattern.held_mask(channel, step)
+            off = sounding & (~held | on)
+            offset = pattern.nudge(channel, step) + (swing_delay if i & 1 else 0)
+            at = max(time + offset * TICKS_PER_STEP // SUBDIVISIONS, 0)
+            for note in range(NOTES):
+                if off & (1 << note):
+                    yield at, bytes((0x80 | channel, FIRST_NOTE + note, 0))
+            for note in range(NOTES):
+                if on & (1 << note):
+                    yield at, bytes((0x90 | channel, FIRST_NOTE + note, pattern.velocity(channel, note, step)))
+            sounding = sounding & ~off | on
+            if gate < 100:
+                next_step = (step + 1) % length
+                ending = sounding & held & (~pattern.held_mask(channel, next_step) | pattern.on_mask(channel, next_step))
+                next_offset = pattern.nudge(channel, next_step) + (0 if i & 1 else swing_delay)
+                end = min(at + gate * TICKS_PER_STEP // 100,
+                          time + TICKS_PER_STEP + next_offset * TICKS_PER_STEP // SUBDIVISIONS)
+                for note in range(NOTES):
+                    if ending & (1 << note):
+                        yield end, bytes((0x80 | channel, FIRST_NOTE + note, 0))
+                sounding &= ~ending
+            time += TICKS_PER_STEP
+    for note in range(NOTES):
+        if sounding & (1 << note):
+            yield time, bytes((0x80 | channel, FIRST_NOTE + note, 0))
+
+
+def variable_length(value):
+    data = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        data.insert(0, value & 0x7F | 0x80)
+        value >>= 7
+    return bytes(data)
+
+
+def write_track(file, events):
+    # the chunk length is patched in afterwards so the events never need
+    # to be held in memory
+    start = file.tell()
+    file.write(b"MTrk\x00\x00\x00\x00")
+    length = 0
+    last_time = 0
+    for time, data in events:
+        chunk = variable_length(time - last_time) + data
+        file.write(chunk)
+        length += len(chunk)
+        last_time = time
+    file.write(b"\x00\xff\x2f\x00")
+    length += 4
+    end = file.tell()
+    file.seek(start + 4)
+    file.write(struct.pack(">I", length))
+    file.seek(end)
+
+
+def meta(kind, data):
+    return bytes((0xFF, kind)) + variable_length(len(data)) + data
+
+
+def export_smf(directory, entries, path, bpm, swing=50):
+    # only channels with notes somewhere in the song get a track
+    used = 0
+    for pattern, _ in segments(directory, entries):
+        for channel in range(CHANNELS):
+            if any(pattern.held_masks[channel * STEPS:(channel + 1) * STEPS]):
+                used |= 1 << channel
+    channels = [channel for channel in range(CHANNELS) if used & (1 << channel)]
+    
+    with open(path, "wb") as file:
+        file.write(b"MThd" + struct.pack(">IHHH", 6, 1, len(channels) + 1, TICKS_PER_BEAT))
+        tempo = round(60000000 / bpm)
+        write_track(file, [
+            (0, meta(0x03, b"seq3")),
+            (0, meta(0x51, tempo.to_bytes(3, "big"))),
+            (0, meta(0x58, bytes((4, 2, 24, 8)))),
+        ])
+        for channel in channels:
+            name = meta(0x03, "channel {}".format(channel + 1).encode())
+            
+            def events(channel=channel, name=name):
+                yield 0, name
+                yield from channel_events(channel, segments(directory, entries), swing)
+            write_track(file, events())
+    return len(channels)
+
+
+# import
+
+def read_variable_length(data, offset):
+    value = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value = value << 7 | byte & 0x7F
+        if not byte & 0x80:
+            return value, offset
+
+
+def read_tracks(path):
+    # yields each track's notes as (channel, note, velocity, start, end),
+    # along with the file's ticks per beat first
+    with open(path, "rb") as file:
+        kind, length = struct.unpack(">4sI", file.read(8))
+        if kind != b"MThd":
+            raise ValueError("{} isn't a midi file".format(path))
+        _, _, division = struct.unpack(">HHH", file.read(length)[:6])
+        if division & 0x8000:
+            raise ValueError("smpte timing isn't supported")
+        yield division
+        
+        while True:
+            chunk = file.read(8)
+            if len(chunk) < 8:
+                return
+            kind, length = struct.unpack(">4sI", chunk)
+            data = file.read(length)
+            if kind == b"MTrk":
+                yield list(track_notes(data))
+
+
+def track_notes(data):
+    offset = 0
+    time = 0
+    status = 0
+    started = {}
+    while offset < len(data):
+        delta, offset = read_variable_length(data, offset)
+        time += delta
+        if data[offset] & 0x80:
+            status = data[offset]
+            offset += 1
+        if status == 0xFF:
+            kind = data[offset]
+            length, offset = read_variable_length(data, offset + 1)
+            offset += length
+            if kind == 0x2F:
+                break
+            continue
+        if status in (0xF0, 0xF7):
+            length, offset = read_variable_length(data, offset)
+            offset += length
+            continue
+        
+        kind = status & 0xF0
+        channel = status & 0x0F
+        if kind in (0xC0, 0xD0):
+            offset += 1
+            continue
+        note, velocity = data[offset], data[offset + 1]
+        offset += 2
+        if kind == 0x90 and velocity:
+            if (channel, note) in started:
+                yield (channel, note) + started[(channel, note)] + (time,)
+            started[(channel, note)] = (velocity, time)
+        elif kind == 0x80 or kind == 0x90:
+            if (channel, note) in started:
+                yield (channel, note) + started.pop((channel, note)) + (time,)
+    for (channel, note), (velocity, start) in started.items():
+        yield channel, note, velocity, start, time
+
+
+def import_smf(path, directory, first_slot, steps):
+    tracks = read_tracks(path)
+    division = next(tracks)
+    patterns = {}
+    skipped = 0
+    end = 0
+    
+    def pattern_at(step):
+        index = step // steps
+        if first_slot + index >= 16:
+            raise ValueError("{} needs more than the 16 slots".format(path))
+        if index not in patterns:
+            patterns[index] = Pattern()
+        return patterns[index], step % steps
+    
+    for notes in tracks:
+        for channel, note, velocity, start, stop in notes:
+            if not FIRST_NOTE <= note < FIRST_NOTE + NOTES:
+                skipped += 1
+                continue
+            first = round(start * 4 / division)
+            last = max(first + 1, round(stop * 4 / division))
+            nudge = round((start * 4 / division - first) * SUBDIVISIONS)
+            if channel == DRUM_CHANNEL:
+                # drums are only ever on or off
+                last = first + 1
+            for step in range(first, last):
+                pattern, index = pattern_at(step)
+                if step == first:
+                    if not pattern.held_mask(channel, index):
+                        # the step's first note decides where it's played
+                        pattern.nudges[channel * STEPS + index] = min(max(nudge, EARLIEST_NUDGE), LATEST_NUDGE)
+                    pattern.set(channel, note - FIRST_NOTE, index, True, velocity)
+                else:
+                    pattern.set(channel, note - FIRST_NOTE, index, False)
+            end = max(end, last)
+    
+    count = (end + steps - 1) // steps
+    for index in range(count):
+        pattern, _ = pattern_at(index * steps)
+        # the last one only runs as many bars as it needs
+        length = min(steps, (end - index * steps + 15) // 16 * 16)
+        for channel in range(CHANNELS):
+            pattern.lengths[channel] = length
+        pattern.save(os.path.join(directory, "{}.bin".format(first_slot + index)))
+    
+    if count > 1:
+        with open(os.path.join(directory, "song.txt"), "w") as file:
+            for index in range(count):
+                file.write("{}\n".format(first_slot + index))
+    return count, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python tools/smf.py", description="convert seq3.py patterns to and from standard midi files")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write saved patterns out as a midi file")
+    export_parser.add_argument("patterns", help="the patterns directory on the drive")
+    export_parser.add_argument("-o", "--output", default="pattern.mid")
+    export_parser.add_argument("--slot", type=int, default=0)
+    export_parser.add_argument("--song", action="store_true", help="export the whole of song.txt rather than one slot")
+    export_parser.add_argument("--repeats", type=int, default=1, help="how many times to play a single slot")
+    export_parser.add_argument("--bpm", type=float, default=143)
+    export_parser.add_argument("--swing", type=int, default=50, help="the swing set on the sequencer, 50 to 75")
+    import_parser = commands.add_parser("import", help="turn a midi file into saved patterns")
+    import_parser.add_argument("midi")
+    import_parser.add_argument("patterns", help="the patterns directory on the drive")
+    import_parser.add_argument("--slot", type=int, default=0, help="the first slot to save to")
+    import_parser.add_argument("--steps", type=int, default=STEPS, help="steps per pattern, up to 64")
+    args = parser.parse_args()
+    
+    if args.command == "export":
+        entries = read_song(args.patterns) if args.song else [(args.slot, args.repeats)]
+        tracks = export_smf(args.patterns, entries, args.output, args.bpm, min(max(args.swing, 50), 75))
+        print("wrote {} channel tracks to {}".format(tracks, args.output))
+    else:
+        os.makedirs(args.patterns, exist_ok=True)
+        count, skipped = import_smf(args.midi, args.patterns, args.slot, min(max(args.steps, 1), STEPS))
+        print("saved {} patterns from slot {}".format(count, args.slot))
+        if skipped:
+            print("skipped {} notes outside {} to {}".format(skipped, FIRST_NOTE, FIRST_NOTE + NOTES - 1))
+
+
+if __name__ == "__main__":
+    main()